@@ -6,13 +6,15 @@ sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 import streamlit as st
 import tempfile
 import os
+import hashlib
+import uuid
 from datetime import datetime
 import pandas as pd
 
-from components.document_processor import DocumentProcessor
-from components.nlp_processor import NLPProcessor
-from components.retrieval_system import DocumentRetriever
-from components.response_generator import ResponseGenerator
+from components.chat_pipeline import LANGUAGE_OPTIONS, ERROR_MESSAGE, create_tenant_components, generate_chatbot_response
+from components.metrics import pipeline_metrics
+from components.ingestion_worker import IngestionQueue
+from components.tenant_collections import DEFAULT_TENANT
 
 st.set_page_config(
     page_title="Document AI Chatbot",
@@ -65,6 +67,14 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Where the vector store is persisted; set DOCUMENT_STORE_PATH to an empty string for an in-memory store
+DOCUMENT_STORE_PATH = os.environ.get("DOCUMENT_STORE_PATH", "vector_store")
+# Worker processes used to parse and embed uploads in the background
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "2"))
+# "shared": all sessions use one document collection, kept across restarts; "session": every browser
+# session gets its own, deleted once unused for TENANT_RETENTION_SECONDS
+COLLECTION_SCOPE = os.environ.get("COLLECTION_SCOPE", "shared")
+
 # Initialize session state
 if 'chatbot_initialized' not in st.session_state:
     st.session_state.chatbot_initialized = False
@@ -72,20 +82,23 @@ if 'chatbot_initialized' not in st.session_state:
     st.session_state.query_count = 0
     st.session_state.confidence_history = []
     st.session_state.processed_files = set()
+    st.session_state.ingestion_jobs = {}
+    st.session_state.tenant_id = uuid.uuid4().hex if COLLECTION_SCOPE == "session" else DEFAULT_TENANT
 
 @st.cache_resource
 def initialize_chatbot():
-    """Initialize chatbot components (cached for performance)"""
+    """
+    Initialize the components shared by all sessions (cached for performance): the per-session
+    collections, NLP processor, response generator and background ingestion worker pool.
+    """
     try:
-        doc_processor = DocumentProcessor()
-        nlp_processor = NLPProcessor()
-        retriever = DocumentRetriever(doc_processor.collection)
-        response_generator = ResponseGenerator()
-        return doc_processor, nlp_processor, retriever, response_generator, True
+        ingestion_queue = IngestionQueue(max_workers=INGESTION_WORKERS)
+        tenants, nlp_processor, response_generator = create_tenant_components(DOCUMENT_STORE_PATH, is_busy=ingestion_queue.has_pending)
+        return tenants, nlp_processor, response_generator, ingestion_queue, True
     except Exception as e:
         st.error(f"Error initializing chatbot: {str(e)}")
         return None, None, None, None, False
-    
+
 def main():
     st.markdown("""
         <div class="main-header">
@@ -94,10 +107,23 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
-    doc_processor, nlp_processor, retriever, response_generator, init_success = initialize_chatbot()
+    tenants, nlp_processor, response_generator, ingestion_queue, init_success = initialize_chatbot()
     if not init_success:
         st.error("Failed to initialize chatbot. Please check API keys and refresh the page.")
         return
+    # This session's collection, reopened from disk if it was unloaded while idle, and kept
+    # loaded for the rest of this run
+    with tenants.lease(st.session_state.tenant_id) as tenant:
+        render_session(tenant, tenants, nlp_processor, response_generator, ingestion_queue)
+
+def render_session(tenant, tenants, nlp_processor, response_generator, ingestion_queue):
+    """Sidebar and chat of one run of the app, over the session's collection."""
+    doc_processor, retriever = tenant.doc_processor, tenant.retriever
+
+    if not st.session_state.chatbot_initialized:
+        # Warm start: documents already in the persistent store count as processed
+        st.session_state.processed_files = doc_processor.list_stored_files()
+        st.session_state.chatbot_initialized = True
     
     with st.sidebar:
         st.header("📄 Document Management")
@@ -108,30 +134,27 @@ def main():
             help="Upload PDF, DOCX, or TXT files to chat with"
         )
         if uploaded_files:
-            process_documents(uploaded_files, doc_processor)
+            process_documents(uploaded_files, ingestion_queue, doc_processor)
+        show_ingestion_status(ingestion_queue)
         
         st.divider()
 
         # Language selection dropdown
         st.header("🌐 Language Settings")
-        language_options = {
-            "en-IN": "English",
-            "hi-IN": "Hindi",
-            "bn-IN": "Bengali",
-            "gu-IN": "Gujarati",
-            "kn-IN": "Kannada",
-            "ml-IN": "Malayalam",
-            "mr-IN": "Marathi",
-            "od-IN": "Odia",
-            "pa-IN": "Punjabi",
-            "ta-IN": "Tamil",
-        }
         selected_language = st.selectbox(
             "Choose Response Language",
-            options=list(language_options.keys()),
-            format_func=lambda x: language_options[x],
+            options=list(LANGUAGE_OPTIONS.keys()),
+            format_func=lambda x: LANGUAGE_OPTIONS[x],
             index=0 # Default to English
         )
+
+        # Restrict answers to some of the uploaded documents; none selected searches them all
+        search_files = st.multiselect(
+            "Search only in",
+            options=sorted(st.session_state.processed_files),
+            help="Leave empty to search all documents"
+        )
+        search_filters = {"file_name": search_files} if search_files else None
         
         st.divider()
         st.header("📊 Statistics")
@@ -144,6 +167,32 @@ def main():
         if st.session_state.confidence_history:
             avg_confidence = sum(st.session_state.confidence_history) / len(st.session_state.confidence_history)
             st.metric("Avg Relevance", f"{avg_confidence:.1%}")
+
+        latency_summary = pipeline_metrics.summary()
+        if latency_summary:
+            with st.expander("⏱️ Latency by stage"):
+                st.dataframe(
+                    pd.DataFrame([
+                        {"Stage": stage, "Count": stats["count"], "Avg (ms)": stats["mean"] * 1000, "p95 (ms)": stats["p95"] * 1000}
+                        for stage, stats in latency_summary.items()
+                    ]).set_index("Stage").round(1),
+                    use_container_width=True
+                )
+                st.download_button("Export (Prometheus)", pipeline_metrics.to_prometheus(), file_name="rag_latency.prom", use_container_width=True)
+                st.download_button("Export (JSON lines)", pipeline_metrics.to_json_lines(), file_name="rag_latency.jsonl", use_container_width=True)
+                cache_stats = retriever.cache_stats()
+                st.caption(
+                    f"Search cache hit rate: {cache_stats['search_results']['hit_rate']:.0%} · "
+                    f"query embedding hit rate: {cache_stats['query_embeddings']['hit_rate']:.0%}"
+                )
+                if response_generator.answer_cache is not None:
+                    st.caption(f"Answer cache hit rate: {response_generator.answer_cache.stats()['hit_rate']:.0%}")
+                tenant_stats = tenants.stats()
+                st.caption(
+                    f"Loaded collections: {tenant_stats['loaded_tenants']} · "
+                    f"~{tenant_stats['memory_bytes'] / 2**20:.0f} / {tenant_stats['memory_budget_bytes'] / 2**20:.0f} MB · "
+                    f"unloaded: {tenant_stats['evictions']}"
+                )
         
         st.divider()
         st.header("⚡ Quick Actions")
@@ -159,32 +208,52 @@ def main():
         display_chat_messages()
 
     # Passing the selected language to handler
-    handle_chat_input(nlp_processor, retriever, response_generator, selected_language)
+    handle_chat_input(nlp_processor, retriever, response_generator, selected_language, search_filters)
 
-def process_documents(uploaded_files, doc_processor):
-    """Process uploaded documents, avoiding duplicates."""
-    with st.spinner("Processing documents... This may take a moment."):
-        new_files_processed = 0
-        total_chunks = 0
-        for uploaded_file in uploaded_files:
-            if uploaded_file.name not in st.session_state.processed_files:
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as temp_file:
-                        temp_file.write(uploaded_file.getvalue())
-                        temp_file_path = temp_file.name
-                    
-                    documents = doc_processor.process_document(temp_file_path)
-                    doc_processor.store_documents(documents)
-                    total_chunks += len(documents)
-                    st.session_state.processed_files.add(uploaded_file.name)
-                    new_files_processed += 1
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    st.error(f"Error processing {uploaded_file.name}: {str(e)}")
-        
-        if new_files_processed > 0:
-            st.success(f"Successfully processed {new_files_processed} new document(s) into {total_chunks} chunks.")
-            st.rerun()
+def process_documents(uploaded_files, ingestion_queue, doc_processor):
+    """Queue uploaded documents for background ingestion; new or changed content is embedded in worker processes."""
+    # Streamlit re-runs this on every interaction, so skip uploads already queued in this session
+    for uploaded_file in uploaded_files:
+        content_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        if content_hash in st.session_state.ingestion_jobs:
+            continue
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as temp_file:
+            temp_file.write(uploaded_file.getvalue())
+            temp_file_path = temp_file.name
+        job = ingestion_queue.submit(temp_file_path, source_name=uploaded_file.name, delete_file=True,
+                                     doc_processor=doc_processor)
+        st.session_state.ingestion_jobs[content_hash] = job.id
+
+def _show_ingestion_status(ingestion_queue):
+    """List this session's ingestion jobs; documents count as processed once their job is stored."""
+    jobs = [ingestion_queue.get_job(job_id) for job_id in st.session_state.ingestion_jobs.values()]
+    jobs = [job for job in jobs if job is not None]
+    if not jobs:
+        return
+
+    status_icons = {"queued": "🕒", "parsing": "📖", "embedding": "🧮", "stored": "✅", "skipped": "⏭️", "failed": "❌"}
+    newly_stored = False
+    for job in jobs:
+        detail = ""
+        if job.status == "embedding" and job.total_chunks:
+            detail = f" ({job.stored_chunks}/{job.total_chunks} chunks searchable)"
+        elif job.status == "stored":
+            detail = f" ({job.summary['chunks']} chunks)"
+        elif job.status == "skipped" and job.summary['status'] == 'duplicate':
+            detail = " (same content as an existing document)"
+        elif job.status == "failed":
+            detail = f": {job.error}"
+        st.caption(f"{status_icons[job.status]} {job.file_name}: {job.status}{detail}")
+
+        if job.status == "stored" and job.file_name not in st.session_state.processed_files:
+            st.session_state.processed_files.add(job.file_name)
+            newly_stored = True
+
+    if newly_stored:
+        st.rerun()
+
+# Poll job status every couple of seconds where Streamlit supports fragments
+show_ingestion_status = st.fragment(run_every=2)(_show_ingestion_status) if hasattr(st, "fragment") else _show_ingestion_status
 
 def display_chat_messages():
     """Display chat message history with improved styling."""
@@ -219,17 +288,32 @@ def display_chat_messages():
             st.markdown('</div>', unsafe_allow_html=True)
 
 # Update function signatures to accept language
-def handle_chat_input(nlp_processor, retriever, response_generator, language: str):
+def handle_chat_input(nlp_processor, retriever, response_generator, language: str, filters=None):
     """Handle chat input and generate responses."""
     user_input = st.chat_input("Ask a question about your documents...")
 
     if user_input:
         st.session_state.messages.append({"role": "user", "content": user_input})
         
+        # English answers are rendered token by token as the model streams them
+        stream_placeholder = st.empty()
+        streamed_tokens = []
+
+        def render_token(token: str):
+            streamed_tokens.append(token)
+            stream_placeholder.markdown(f"""
+                <div class="bot-message-container">
+                    <div class="chat-message bot-message">
+                        <strong>🤖 Assistant:</strong> {''.join(streamed_tokens)}
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+
         with st.spinner("🤔 Thinking..."):
             try:
                 # Pass the selected language down to the response generation pipeline
-                response_data = generate_chatbot_response(user_input, nlp_processor, retriever, response_generator, language)
+                response_data = generate_chatbot_response(user_input, nlp_processor, retriever, response_generator, language,
+                                                          on_token=render_token, filters=filters)
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": response_data["response"],
@@ -241,40 +325,10 @@ def handle_chat_input(nlp_processor, retriever, response_generator, language: st
                 st.error(f"Error generating response: {str(e)}")
                 st.session_state.messages.append({
                     "role": "assistant",
-                    "content": "Sorry, I encountered an error. Please try again.",
+                    "content": nlp_processor.translate_text(ERROR_MESSAGE, source_lang='en-IN', target_lang=language),
                     "confidence": 0.0
                 })
         st.rerun()
 
-def generate_chatbot_response(query: str, nlp_processor, retriever, response_generator, language: str):
-    """Orchestrate the full RAG pipeline for a multilingual response."""
-    
-    # 1. Translate user's query to English for searching.
-    # The source language is auto-detected. The target is our consistent pivot language, 'en-IN'.
-    english_query = nlp_processor.translate_text(query, source_lang="auto", target_lang='en-IN')
-
-    if not english_query or not english_query.strip():
-        return {"response": "I could not understand your question. Please try rephrasing.", "confidence": 0.0}
-
-    # 2. Retrieve relevant documents using the English query
-    retrieved_docs = retriever.hybrid_search(english_query, k=5)
-
-    # 3. Handle the case where no relevant documents are found
-    if not retrieved_docs:
-        not_found_message = "I couldn't find relevant information in your documents to answer that. Please try rephrasing your question."
-        # Translate the "not found" message back to the user's CHOSEN language
-        translated_not_found = nlp_processor.translate_text(not_found_message, source_lang='en-IN', target_lang=language)
-        return {"response": translated_not_found, "confidence": 0.0}
-    
-    # 4. Generate a response using the LLM. Pass the user's chosen language for the final translation step.
-    response = response_generator.generate_response(
-        english_query, retrieved_docs, nlp_processor, target_language=language
-    )
-
-    # 5. Calculate confidence based on relevance of retrieved docs
-    confidence = sum(doc.get('score', 0) for doc in retrieved_docs) / len(retrieved_docs) if retrieved_docs else 0.0
-    
-    return {"response": response, "confidence": confidence}
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import shutil
+from typing import Dict, List, Optional
+import numpy as np
+from tqdm import tqdm
+
+# Run from the repository root: python -m benchmarks.retrieval_benchmark --sizes 10000 100000 1000000
+from components.document_processor import DocumentProcessor
+from components.retrieval_system import DocumentRetriever
+from components.vector_store import DEFAULT_NPROBE, VECTOR_DTYPES, VECTOR_STORE_BACKENDS
+
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_QUERIES = 200
+EMBEDDING_DIM = 768
+INGEST_BATCH_SIZE = 1000
+RESULTS_FILE = "benchmark_results.json"
+
+# Character sets the synthetic vocabularies are built from, so the keyword index sees real multi-script text
+SCRIPTS = {
+    'en': [chr(c) for c in range(ord('a'), ord('z') + 1)],
+    'hi': [chr(c) for c in range(0x0915, 0x0939 + 1)] + [chr(c) for c in range(0x093E, 0x094C + 1)],
+    'ta': [chr(c) for c in range(0x0B95, 0x0BB9 + 1)] + [chr(c) for c in range(0x0BBE, 0x0BCC + 1)],
+}
+
+class RandomEmbeddingModel:
+    """
+    Stand-in for the SentenceTransformer: deterministic unit vectors derived from a hash of each text.
+    Retrieval quality is meaningless, but the shapes, dtypes and cost of the vector search are real,
+    and no model has to be downloaded.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences: List[str], batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        vectors = np.stack([
+            np.random.default_rng(zlib.crc32(sentence.encode('utf-8'))).standard_normal(self.dim, dtype=np.float32)
+            for sentence in sentences
+        ])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class SyntheticCorpus:
+    """Chunks of Zipf-distributed words drawn from one synthetic vocabulary per script."""
+
+    def __init__(self, languages: List[str], vocabulary_size: int = 20_000, words_per_chunk: int = 150, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.languages = languages
+        self.words_per_chunk = words_per_chunk
+        self.vocabularies = {lang: self._vocabulary(SCRIPTS[lang], vocabulary_size) for lang in languages}
+        ranks = np.arange(1, vocabulary_size + 1)
+        self.word_probabilities = (1.0 / ranks) / np.sum(1.0 / ranks)
+
+    def _vocabulary(self, alphabet: List[str], size: int) -> List[str]:
+        lengths = self.rng.integers(3, 9, size=size)
+        return ["".join(self.rng.choice(alphabet, size=length)) for length in lengths]
+
+    def _words(self, lang: str, count: int) -> str:
+        indices = self.rng.choice(len(self.vocabularies[lang]), size=count, p=self.word_probabilities)
+        vocabulary = self.vocabularies[lang]
+        return " ".join(vocabulary[i] for i in indices)
+
+    def chunks(self, count: int, start: int = 0) -> List[Dict]:
+        documents = []
+        for i in range(start, start + count):
+            lang = self.languages[i % len(self.languages)]
+            documents.append({
+                'id': f"synthetic_{lang}_{i}",
+                'content': self._words(lang, self.words_per_chunk),
+                'metadata': {'file_name': f"synthetic_{lang}_{i // 100}.txt", 'language': lang, 'chunk_index': i},
+            })
+        return documents
+
+    def queries(self, count: int) -> List[str]:
+        return [self._words(self.languages[i % len(self.languages)], int(self.rng.integers(3, 8))) for i in range(count)]
+
+def _rss_mb() -> Dict[str, float]:
+    """Current (from /proc, Linux only) and peak resident memory of this process in MB."""
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak_kb / 1024 if sys.platform != 'darwin' else peak_kb / (1024 * 1024)
+    current_mb = None
+    try:
+        with open('/proc/self/statm') as f:
+            current_mb = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    return {'rss_mb': current_mb, 'peak_rss_mb': peak_mb}
+
+def _latency_stats(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = (float(value) for value in np.percentile(samples, [50, 95, 99]) * 1000)
+    return {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'mean_ms': float(np.mean(samples)) * 1000,
+            'queries_per_second': len(samples) / sum(samples)}
+
+def benchmark_size(size: int, corpus: SyntheticCorpus, model: RandomEmbeddingModel, queries: List[str], k: int,
+                   embeddings: Optional[np.ndarray] = None, persist_directory: Optional[str] = None,
+                   vector_store: str = "chroma", vector_dtype: str = "float32", nprobe: int = DEFAULT_NPROBE) -> Dict:
+    """Ingest `size` synthetic chunks into a fresh collection, then time each search mode."""
+    collection_name = f"benchmark_{size}"
+    processor = DocumentProcessor(embedding_model=model, persist_directory=persist_directory, collection_name=collection_name,
+                                  vector_store=vector_store, vector_dtype=vector_dtype)
+    if vector_store == "ivf":
+        processor.collection.nprobe = nprobe
+    memory_before = _rss_mb()
+
+    # Only store_documents (vector upsert + keyword indexing) is timed, not generating the synthetic data
+    ingest_seconds = 0.0
+    for start in tqdm(range(0, size, INGEST_BATCH_SIZE), desc=f"Ingesting {size:,} chunks"):
+        documents = corpus.chunks(min(INGEST_BATCH_SIZE, size - start), start=start)
+        if embeddings is not None:
+            vectors = embeddings[np.arange(start, start + len(documents)) % len(embeddings)]
+        else:
+            vectors = model.encode([doc['content'] for doc in documents])
+        for doc, vector in zip(documents, vectors):
+            doc['embedding'] = np.asarray(vector, dtype=np.float32)
+        batch_start = time.perf_counter()
+        processor.store_documents(documents)
+        ingest_seconds += time.perf_counter() - batch_start
+    memory_after = _rss_mb()
+
+    # No collection_version: the results cache stays off so every query does the full search
+    retriever = DocumentRetriever(processor.collection, embedding_model=model, keyword_index=processor.keyword_index)
+    modes = {
+        'semantic': lambda query: retriever.similarity_search(query, k=k),
+        'keyword': lambda query: retriever.keyword_search(query, k=k),
+        'hybrid': lambda query: retriever.hybrid_search(query, k=k),
+    }
+    latencies = {}
+    for mode, search in modes.items():
+        search(queries[0])  # warm-up
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            samples.append(time.perf_counter() - start)
+        latencies[mode] = _latency_stats(samples)
+
+    vector_bytes = processor.collection.memory_bytes() if hasattr(processor.collection, 'memory_bytes') else None
+    processor.collection.drop()
+    return {
+        'size': size,
+        'vector_index_bytes': vector_bytes,
+        'ingest_seconds': ingest_seconds,
+        'ingest_chunks_per_second': size / ingest_seconds,
+        'memory_before': memory_before,
+        'memory_after_ingest': memory_after,
+        'search': latencies,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes: List[int], query_count: int, k: int, languages: List[str],
+                   embeddings_path: Optional[str] = None, persist: bool = False, vector_store: str = "chroma",
+                   vector_dtype: str = "float32", nprobe: int = DEFAULT_NPROBE) -> Dict:
+    embeddings = np.load(embeddings_path, mmap_mode='r') if embeddings_path else None
+    model = RandomEmbeddingModel(embeddings.shape[1] if embeddings is not None else EMBEDDING_DIM)
+    corpus = SyntheticCorpus(languages)
+    queries = corpus.queries(query_count)
+
+    results = []
+    for size in sizes:
+        persist_directory = tempfile.mkdtemp(prefix="retrieval_benchmark_") if persist else None
+        try:
+            result = benchmark_size(size, corpus, model, queries, k, embeddings, persist_directory,
+                                    vector_store, vector_dtype, nprobe)
+        finally:
+            if persist_directory:
+                shutil.rmtree(persist_directory, ignore_errors=True)
+        results.append(result)
+        print(f"{size:>10,} chunks: ingest {result['ingest_chunks_per_second']:,.0f} chunks/s, " + ", ".join(
+            f"{mode} p50 {stats['p50_ms']:.1f} ms / p95 {stats['p95_ms']:.1f} ms"
+            for mode, stats in result['search'].items()
+        ))
+
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'queries': query_count,
+            'k': k,
+            'languages': languages,
+            'embedding_dim': model.dim,
+            'embeddings': embeddings_path or 'random',
+            'persisted': persist,
+            'vector_store': vector_store,
+            'vector_dtype': vector_dtype,
+            'nprobe': nprobe if vector_store == "ivf" else None,
+        },
+        'results': results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and search on synthetic corpora of increasing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes in chunks.")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries timed per search mode.")
+    parser.add_argument("--k", type=int, default=10, help="Results per query.")
+    parser.add_argument("--languages", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--embeddings", help="Optional .npy matrix of precomputed chunk embeddings (rows are reused cyclically).")
+    parser.add_argument("--persist", action="store_true", help="Benchmark the on-disk store instead of the in-memory one.")
+    parser.add_argument("--vector-store", default="chroma", choices=VECTOR_STORE_BACKENDS, help="Vector store backend.")
+    parser.add_argument("--dtype", default="float32", choices=VECTOR_DTYPES, help="Vector precision of the numpy / ivf stores.")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="IVF lists searched per query.")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the JSON results.")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.queries, args.k, args.languages, args.embeddings, args.persist,
+                            args.vector_store, args.dtype, args.nprobe)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+import numpy as np
+
+# Cosine similarity above which two English queries over the same chunks are treated as the same question
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+class CachedAnswer:
+    def __init__(self, embedding: np.ndarray, scope: Tuple[FrozenSet[str], int], english_answer: str):
+        self.embedding = embedding
+        self.scope = scope
+        self.english_answer = english_answer
+        self.translations: Dict[str, str] = {}
+        self.created_at = time.time()
+
+class SemanticAnswerCache:
+    """
+    Generated answers keyed by the English query embedding, the set of retrieved chunk IDs and the
+    collection version. A lookup only compares against answers produced from exactly the same
+    chunks and collection version, and hits when the cosine similarity reaches the threshold.
+    Entries hold the English answer plus any translations made from it, expire after ttl_seconds,
+    and the least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(self, similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl_seconds: float = 3600, max_entries: int = 2048):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._by_scope: Dict[Tuple[FrozenSet[str], int], List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def lookup(self, query_embedding: np.ndarray, chunk_ids: Iterable[str], collection_version: int) -> Optional[CachedAnswer]:
+        """Return the closest cached answer for the same chunks and collection version, if similar enough."""
+        scope = (frozenset(chunk_ids), collection_version)
+        query_embedding = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in list(self._by_scope.get(scope, [])):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.dot(entry.embedding, query_embedding))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id]
+
+    def store(self, query_embedding: np.ndarray, chunk_ids: Iterable[str], collection_version: int,
+              english_answer: str) -> CachedAnswer:
+        entry = CachedAnswer(self._normalize(query_embedding), (frozenset(chunk_ids), collection_version), english_answer)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_scope.setdefault(entry.scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._by_scope[entry.scope]
+        scope_ids.remove(entry_id)
+        if not scope_ids:
+            del self._by_scope[entry.scope]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,121 @@
+import os
+from typing import Callable, Dict, Optional, Tuple
+from .document_processor import DEFAULT_COLLECTION_NAME, DocumentProcessor
+from .nlp_processor import NLPProcessor
+from .translation_cache import TranslationCache
+from .retrieval_system import DocumentRetriever
+from .response_generator import ResponseGenerator
+from .answer_cache import SemanticAnswerCache
+from .model_registry import get_embedding_model, get_embedding_cache
+from .metrics import pipeline_metrics
+from .tenant_collections import TenantCollections
+
+# Vector store backend: chroma, numpy (exact) or ivf; defaults to chroma, or numpy when a dtype is set.
+# VECTOR_STORE_DTYPE (float32, float16 or int8) selects the NumPy stores' precision;
+# VECTOR_STORE_RESCORE=0 skips the full-precision re-scoring of the top candidates
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND") or None
+VECTOR_STORE_DTYPE = os.environ.get("VECTOR_STORE_DTYPE") or None
+VECTOR_STORE_RESCORE = os.environ.get("VECTOR_STORE_RESCORE", "1") != "0"
+
+LANGUAGE_OPTIONS = {
+    "en-IN": "English",
+    "hi-IN": "Hindi",
+    "bn-IN": "Bengali",
+    "gu-IN": "Gujarati",
+    "kn-IN": "Kannada",
+    "ml-IN": "Malayalam",
+    "mr-IN": "Marathi",
+    "od-IN": "Odia",
+    "pa-IN": "Punjabi",
+    "ta-IN": "Tamil",
+}
+
+# Fixed responses, pre-translated into every language at startup so they never hit the translation API per query
+NOT_UNDERSTOOD_MESSAGE = "I could not understand your question. Please try rephrasing."
+NOT_FOUND_MESSAGE = "I couldn't find relevant information in your documents to answer that. Please try rephrasing your question."
+ERROR_MESSAGE = "Sorry, I encountered an error. Please try again."
+FALLBACK_MESSAGES = [NOT_UNDERSTOOD_MESSAGE, NOT_FOUND_MESSAGE, ERROR_MESSAGE]
+
+def create_document_processor(persist_directory: Optional[str] = None,
+                              collection_name: str = DEFAULT_COLLECTION_NAME) -> DocumentProcessor:
+    """Open a collection with the shared embedding model and cache and the configured vector store."""
+    return DocumentProcessor(embedding_model=get_embedding_model(), persist_directory=persist_directory or None,
+                             collection_name=collection_name, embedding_cache=get_embedding_cache(),
+                             vector_store=VECTOR_STORE_BACKEND, vector_dtype=VECTOR_STORE_DTYPE,
+                             rescore=VECTOR_STORE_RESCORE)
+
+def create_shared_components(sarvam_api_key: Optional[str] = None,
+                             hf_token: Optional[str] = None) -> Tuple[NLPProcessor, ResponseGenerator]:
+    """The NLP processor and response generator, which hold no per-collection state."""
+    nlp_processor = NLPProcessor(translation_cache=TranslationCache(), api_key=sarvam_api_key)
+    nlp_processor.warm_cache(FALLBACK_MESSAGES, [lang for lang in LANGUAGE_OPTIONS if lang != 'en-IN'])
+    response_generator = ResponseGenerator(hf_token=hf_token, answer_cache=SemanticAnswerCache())
+    return nlp_processor, response_generator
+
+def create_pipeline_components(persist_directory: Optional[str] = None, sarvam_api_key: Optional[str] = None,
+                               hf_token: Optional[str] = None) -> Tuple[DocumentProcessor, NLPProcessor, DocumentRetriever, ResponseGenerator]:
+    """
+    Build the document processor, NLP processor, retriever and response generator around one shared
+    embedding model and cache. API keys default to the Streamlit secrets when not given.
+    """
+    doc_processor = create_document_processor(persist_directory)
+    nlp_processor, response_generator = create_shared_components(sarvam_api_key, hf_token)
+    retriever = DocumentRetriever(doc_processor.collection, embedding_model=doc_processor.embedding_model,
+                                  keyword_index=doc_processor.keyword_index, embedding_cache=doc_processor.embedding_cache,
+                                  collection_version=lambda: doc_processor.collection_version)
+    return doc_processor, nlp_processor, retriever, response_generator
+
+def create_tenant_components(persist_directory: Optional[str] = None, sarvam_api_key: Optional[str] = None,
+                             hf_token: Optional[str] = None,
+                             is_busy: Optional[Callable[[DocumentProcessor], bool]] = None) -> Tuple[TenantCollections, NLPProcessor, ResponseGenerator]:
+    """
+    Like create_pipeline_components, but with one collection per tenant (see TenantCollections):
+    the embedding model, its cache, the API clients and the answer cache stay shared.
+    """
+    tenants = TenantCollections(create_document_processor, persist_directory=persist_directory or None, is_busy=is_busy)
+    nlp_processor, response_generator = create_shared_components(sarvam_api_key, hf_token)
+    return tenants, nlp_processor, response_generator
+
+def generate_chatbot_response(query: str, nlp_processor: NLPProcessor, retriever: DocumentRetriever,
+                              response_generator: ResponseGenerator, language: str,
+                              on_token: Optional[Callable[[str], None]] = None, filters: Optional[Dict] = None) -> Dict:
+    """
+    Orchestrate the full RAG pipeline for a multilingual response; on_token receives streamed English tokens.
+    filters restrict retrieval to matching chunks, e.g. {'file_name': ['report.pdf']} (see DocumentRetriever).
+    """
+    with pipeline_metrics.span("chat_total"):
+        return _run_chat_pipeline(query, nlp_processor, retriever, response_generator, language, on_token, filters)
+
+def _run_chat_pipeline(query: str, nlp_processor, retriever, response_generator, language: str, on_token=None,
+                       filters: Optional[Dict] = None) -> Dict:
+    # 1. Translate user's query to English for searching.
+    # The source language is auto-detected. The target is our consistent pivot language, 'en-IN'.
+    english_query = nlp_processor.translate_text(query, source_lang="auto", target_lang='en-IN')
+
+    if not english_query or not english_query.strip():
+        translated_not_understood = nlp_processor.translate_text(NOT_UNDERSTOOD_MESSAGE, source_lang='en-IN', target_lang=language)
+        return {"response": translated_not_understood, "confidence": 0.0}
+
+    # 2. Retrieve relevant documents using the English query
+    retrieved_docs = retriever.hybrid_search(english_query, k=5, filters=filters)
+
+    # 3. Handle the case where no relevant documents are found
+    if not retrieved_docs:
+        # Translate the "not found" message back to the user's CHOSEN language (served from the warmed cache)
+        translated_not_found = nlp_processor.translate_text(NOT_FOUND_MESSAGE, source_lang='en-IN', target_lang=language)
+        return {"response": translated_not_found, "confidence": 0.0}
+    
+    # 4. Generate a response using the LLM. Pass the user's chosen language for the final translation step.
+    # A near-identical question over the same chunks is answered from the answer cache instead; the query
+    # embedding is already in the retriever's cache from the search above.
+    collection_version = retriever.collection_version() if retriever.collection_version else None
+    query_embedding = retriever.embed_query(english_query) if collection_version is not None else None
+    response = response_generator.generate_response(
+        english_query, retrieved_docs, nlp_processor, target_language=language, on_token=on_token,
+        query_embedding=query_embedding, collection_version=collection_version
+    )
+
+    # 5. Calculate confidence based on relevance of retrieved docs
+    confidence = sum(doc.get('score', 0) for doc in retrieved_docs) / len(retrieved_docs) if retrieved_docs else 0.0
+    
+    return {"response": response, "confidence": confidence}
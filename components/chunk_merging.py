@@ -0,0 +1,102 @@
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from .chunking_config import CHUNK_OVERLAP
+
+# Shortest suffix/prefix match treated as the splitter's overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 20
+# Share of a chunk's word shingles found in an already kept chunk above which it is dropped as a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.9
+SHINGLE_SIZE = 3
+
+def _source_key(doc: Dict) -> Optional[str]:
+    metadata = doc.get('metadata') or {}
+    return metadata.get('file_name') or (os.path.basename(metadata['source']) if metadata.get('source') else None)
+
+def _chunk_index(doc: Dict) -> Optional[int]:
+    index = (doc.get('metadata') or {}).get('chunk_index')
+    return index if isinstance(index, int) else None
+
+def join_overlapping(first: str, second: str, max_overlap: int = CHUNK_OVERLAP) -> str:
+    """Concatenate two consecutive chunks, writing the text they share (the splitter's overlap) only once."""
+    longest = min(len(first), len(second), max_overlap)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    # Consecutive but not overlapping, e.g. the last chunk of one page and the first of the next
+    return f"{first}\n{second}"
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def merge_adjacent_chunks(docs: List[Dict], max_overlap: int = CHUNK_OVERLAP) -> List[Dict]:
+    """
+    Merge retrieved chunks that are consecutive in the same source (by 'chunk_index') into one span,
+    so the text they overlap on appears once. A merged span takes the place of its best ranked chunk,
+    its highest score, the metadata of its first chunk, and lists its chunk IDs under 'merged_ids'.
+    Chunks without a source or chunk index are passed through unchanged.
+    """
+    runs_by_doc: Dict[int, List[int]] = {}
+    by_source: Dict[str, List[int]] = {}
+    for position, doc in enumerate(docs):
+        source = _source_key(doc)
+        if source is not None and _chunk_index(doc) is not None:
+            by_source.setdefault(source, []).append(position)
+
+    for positions in by_source.values():
+        positions.sort(key=lambda position: _chunk_index(docs[position]))
+        run = [positions[0]]
+        for position in positions[1:]:
+            step = _chunk_index(docs[position]) - _chunk_index(docs[run[-1]])
+            if step == 0:
+                # The same chunk twice (e.g. returned by both search legs): keep one
+                continue
+            if step == 1:
+                run.append(position)
+                continue
+            runs_by_doc[min(run)] = run
+            run = [position]
+        runs_by_doc[min(run)] = run
+
+    merged = []
+    for position, doc in enumerate(docs):
+        run = runs_by_doc.get(position)
+        if run is None:
+            if _source_key(doc) is None or _chunk_index(doc) is None:
+                merged.append(doc)
+            continue
+        if len(run) == 1:
+            merged.append(doc)
+            continue
+        content = docs[run[0]].get('content', '')
+        for next_position in run[1:]:
+            content = join_overlapping(content, docs[next_position].get('content', ''), max_overlap)
+        merged.append({
+            'id': docs[run[0]]['id'],
+            'merged_ids': [docs[i]['id'] for i in run],
+            'content': content,
+            'metadata': dict(docs[run[0]].get('metadata') or {}),
+            'score': max(docs[i].get('score', 0) for i in run),
+        })
+    return merged
+
+def drop_near_duplicates(docs: List[Dict], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Dict]:
+    """
+    Drop chunks whose text is (almost) entirely contained in a better ranked one, e.g. the same
+    passage stored under two file names, or boilerplate repeated on every page.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.get('content', ''))
+        if shingles and any(len(shingles & other) / len(shingles) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+def deduplicate_chunks(docs: List[Dict], max_overlap: int = CHUNK_OVERLAP,
+                       threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Dict]:
+    """Merge adjacent chunks of the same source, then drop near-duplicates, keeping the retrieval order."""
+    return drop_near_duplicates(merge_adjacent_chunks(docs, max_overlap), threshold)
@@ -0,0 +1,4 @@
+# Splitter settings, kept free of heavy imports so lightweight modules (e.g. chunk_merging) can share them
+CHUNK_SIZE = 1000
+# Characters consecutive chunks of a document have in common
+CHUNK_OVERLAP = 150
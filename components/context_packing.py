@@ -0,0 +1,123 @@
+import math
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Packing strategies: "greedy" takes chunks in rank order, skipping those that do not fit;
+# "knapsack" picks the set of chunks with the highest total retrieval score that fits
+PACKING_STRATEGIES = ("greedy", "knapsack")
+# Added to every chunk's score in the knapsack, so chunks normalized to a score of 0 still fill spare room
+KNAPSACK_BASE_VALUE = 0.05
+# The knapsack table has at most this many token columns; larger budgets are counted in coarser steps
+KNAPSACK_MAX_COLUMNS = 1000
+# A chunk is only cut down to fit when at least this many tokens are left
+MIN_TRUNCATED_TOKENS = 48
+# Latin, Devanagari (danda) and other sentence endings, followed by whitespace
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?।॥])\s+")
+
+_tokenizers: Dict[str, object] = {}
+_lock = threading.Lock()
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokenizer-free upper estimate: one token per 3 UTF-8 bytes. This is about one per 3 characters
+    of English and one per character of Indic scripts (3 bytes each), where byte-level tokenizers
+    split words much more finely.
+    """
+    return len(text.encode('utf-8')) // 3 + 1
+
+def get_token_counter(tokenizer_name: Optional[str], hf_token: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Token counter for the model's tokenizer (a Hub name or a local directory), loaded once per process.
+    Falls back to estimate_tokens when no name is given or the tokenizer cannot be loaded.
+    """
+    if not tokenizer_name:
+        return estimate_tokens
+    with _lock:
+        if tokenizer_name not in _tokenizers:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizers[tokenizer_name] = AutoTokenizer.from_pretrained(tokenizer_name, token=hf_token)
+            except Exception as e:
+                print(f"Could not load tokenizer '{tokenizer_name}' ({e}); estimating token counts from text length")
+                _tokenizers[tokenizer_name] = None
+        tokenizer = _tokenizers[tokenizer_name]
+    if tokenizer is None:
+        return estimate_tokens
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+def truncate_to_sentences(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """The longest run of whole leading sentences of text within max_tokens ('' if not even the first fits)."""
+    sentences = SENTENCE_END_PATTERN.split(text)
+    # Binary search over the number of sentences kept, so the tokenizer runs O(log n) times
+    low, high = 0, len(sentences)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(sentences[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(sentences[:low])
+
+def _knapsack(weights: List[int], values: List[float], budget: int) -> List[int]:
+    """Indices of the items with the highest total value whose weights fit the budget (0/1 knapsack)."""
+    step = max(1, math.ceil(budget / KNAPSACK_MAX_COLUMNS))
+    capacity = budget // step
+    # Rounding weights up keeps every chosen set within the real budget
+    scaled = [math.ceil(weight / step) for weight in weights]
+    best = [0.0] * (capacity + 1)
+    taken = [[False] * (capacity + 1) for _ in weights]
+    for i, (weight, value) in enumerate(zip(scaled, values)):
+        for room in range(capacity, weight - 1, -1):
+            if best[room - weight] + value > best[room]:
+                best[room] = best[room - weight] + value
+                taken[i][room] = True
+
+    chosen, room = [], capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if taken[i][room]:
+            chosen.append(i)
+            room -= scaled[i]
+    return sorted(chosen)
+
+def pack_context(docs: List[Dict], budget: int, count_tokens: Callable[[str], int],
+                 format_part: Callable[[Dict, str], str], strategy: str = "greedy",
+                 truncate: bool = True) -> List[Tuple[Dict, str]]:
+    """
+    Choose which retrieved chunks (best first) go into a context of at most `budget` tokens.
+    Each chunk's cost is measured on its formatted part, format_part(doc, content). With truncate,
+    the leftover room is filled with the leading sentences of the best chunk that did not fit.
+    Returns (doc, content) pairs in rank order.
+    """
+    if strategy not in PACKING_STRATEGIES:
+        raise ValueError(f"Unknown packing strategy '{strategy}'. Available: {', '.join(PACKING_STRATEGIES)}")
+    costs = [count_tokens(format_part(doc, doc.get('content', ''))) for doc in docs]
+
+    if strategy == "knapsack":
+        values = [max(doc.get('score', 0.0), 0.0) + KNAPSACK_BASE_VALUE for doc in docs]
+        chosen = set(_knapsack(costs, values, budget))
+    else:
+        chosen, used = set(), 0
+        for i, cost in enumerate(costs):
+            if used + cost <= budget:
+                chosen.add(i)
+                used += cost
+    remaining = budget - sum(costs[i] for i in chosen)
+
+    truncated: Dict[int, str] = {}
+    if truncate and remaining >= MIN_TRUNCATED_TOKENS:
+        for i, doc in enumerate(docs):
+            if i in chosen:
+                continue
+            overhead = count_tokens(format_part(doc, ""))
+            content = truncate_to_sentences(doc.get('content', ''), remaining - overhead, count_tokens)
+            # Tokens can merge across the join, so check the formatted part as a whole
+            if content and count_tokens(format_part(doc, content)) <= remaining:
+                truncated[i] = content
+                break
+
+    return [
+        (doc, truncated.get(i, doc.get('content', '')))
+        for i, doc in enumerate(docs)
+        if i in chosen or i in truncated
+    ]
@@ -1,60 +1,421 @@
+import hashlib
+import itertools
+import json
 import os
-from typing import List, Dict
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from sentence_transformers import SentenceTransformer
-import chromadb
+from .model_registry import get_embedding_model
+from .chunking_config import CHUNK_OVERLAP, CHUNK_SIZE
+from .keyword_index import BM25Index
+from .language_detection import detect_language
+from .embedding_cache import EmbeddingCache, encode_texts
+from .vector_store import create_vector_store, delete_vector_store
 
-class DocumentProcessor:
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        self.embedding_model = SentenceTransformer('intfloat/multilingual-e5-base')
-        self.chroma_client = chromadb.Client()
-        self.collection = self.chroma_client.get_or_create_collection("multilingual_documents")
-
-    def process_document(self, file_path: str) -> List[Dict]:
-        """Load and process documents based on file type."""
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.pdf':
-            loader = PyPDFLoader(file_path)
-        elif file_extension == '.docx':
-            loader = Docx2txtLoader(file_path)
-        elif file_extension == '.txt':
-            loader = TextLoader(file_path, encoding='utf-8')
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-        
-        docs = loader.load()
-        chunks = self.text_splitter.split_documents(docs)
-        documents = []
-
-        for i, chunk in enumerate(chunks):
+DEFAULT_BATCH_SIZE = 32
+# Chunks embedded and written to the store at a time while streaming a document in
+DEFAULT_FLUSH_SIZE = 256
+DEFAULT_COLLECTION_NAME = "multilingual_documents"
+KEYWORD_INDEX_FILE = "keyword_index.json"
+# File name -> file hash of every stored file (None while its ingestion is unfinished), next to the keyword index
+COMPLETED_FILES_FILE = "files.json"
+# Collection versions come from one process-wide counter, so two collections (e.g. of different
+# tenants) never share a version and caches keyed by chunk IDs and version cannot mix them up
+_collection_versions = itertools.count(1)
+
+def compute_file_hash(file_path: str) -> str:
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compute_text_hash(text: str) -> str:
+    """SHA-256 of a chunk's text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def iter_document_chunks(file_path: str, source_name: Optional[str] = None,
+                         text_splitter: Optional[RecursiveCharacterTextSplitter] = None) -> Iterator[Dict]:
+    """
+    Lazily load a document based on file type and yield chunk dicts (id, content, metadata), without embeddings.
+    Pages are read and split one at a time, so memory does not grow with the document's size.
+    Like split_documents, each page is split on its own: chunks never span a page boundary,
+    which keeps chunk IDs and 'page' metadata identical to loading the whole file at once.
+    source_name is the user-facing file name (e.g. of an upload saved to a temp file);
+    it defaults to the file's basename and is used for chunk IDs and the 'file_name' metadata.
+    """
+    text_splitter = text_splitter or RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    file_name = source_name or os.path.basename(file_path)
+    file_hash = compute_file_hash(file_path)
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.pdf':
+        loader = PyPDFLoader(file_path)
+    elif file_extension == '.docx':
+        loader = Docx2txtLoader(file_path)
+    elif file_extension == '.txt':
+        loader = TextLoader(file_path, encoding='utf-8')
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+    chunk_index = 0
+    for page in loader.lazy_load():
+        for chunk in text_splitter.split_documents([page]):
             metadata = chunk.metadata
             for key, value in metadata.items():
                 if not isinstance(value, (str, int, float, bool)):
                     metadata[key] = str(value)
+            metadata['file_name'] = file_name
+            metadata['file_hash'] = file_hash
+            metadata['chunk_hash'] = compute_text_hash(chunk.page_content)
+            metadata['chunk_index'] = chunk_index
+            metadata['language'] = detect_language(chunk.page_content)
 
-            text_to_embed = f"passage: {chunk.page_content}"
-
-            doc_data = {
-                'id': f"{os.path.basename(file_path)}_{i}",
+            yield {
+                'id': f"{file_name}_{chunk_index}",
                 'content': chunk.page_content,
-                'metadata': metadata,
-                'embedding': self.embedding_model.encode(text_to_embed)
+                'metadata': metadata
             }
-            documents.append(doc_data)
+            chunk_index += 1
+
+def load_document_chunks(file_path: str, source_name: Optional[str] = None,
+                         text_splitter: Optional[RecursiveCharacterTextSplitter] = None) -> List[Dict]:
+    """
+    All chunk dicts of a document as a list (see iter_document_chunks).
+    """
+    return list(iter_document_chunks(file_path, source_name=source_name, text_splitter=text_splitter))
+
+def delete_collection_files(persist_directory: str, collection_name: str):
+    """
+    Delete a persisted collection without opening it. The keyword index goes last: it marks a
+    collection as present, so an interrupted deletion is picked up again.
+    """
+    delete_vector_store(collection_name, persist_directory)
+    for suffix in (COMPLETED_FILES_FILE, KEYWORD_INDEX_FILE):
+        path = os.path.join(persist_directory, f"{collection_name}_{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most `size` items."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class DocumentProcessor:
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, embedding_model: Optional[SentenceTransformer] = None,
+                 persist_directory: Optional[str] = None, collection_name: str = DEFAULT_COLLECTION_NAME,
+                 embedding_cache: Optional[EmbeddingCache] = None, vector_store: Optional[str] = None,
+                 vector_dtype: Optional[str] = None, rescore: bool = True):
+        """
+        vector_store selects the store backend ('chroma', 'numpy' or 'ivf', see vector_store.py);
+        by default chunks go to Chroma, or to the NumPy store when vector_dtype ('float32', 'float16'
+        or 'int8') is given. The NumPy stores can re-score their top candidates at full precision.
+        """
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        self._embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
+        self.batch_size = batch_size
+        self.persist_directory = persist_directory
+        # Reopening the same persist_directory picks up the existing collection
+        self.collection = create_vector_store(
+            vector_store or ("numpy" if vector_dtype else "chroma"), collection_name, path=persist_directory,
+            dtype=vector_dtype or "float32", rescore=rescore
+        )
+        self.keyword_index = self._load_keyword_index(collection_name)
+        self._completed_files_lock = threading.Lock()
+        self.completed_files = self._load_completed_files(collection_name)
+        # Open deferred_index_saves() blocks; the keyword index is only written once none is left
+        self._deferred_saves = 0
+        self._deferred_saves_lock = threading.Lock()
+        # Bumped after every write, so result caches built on this collection know when they are stale
+        self.collection_version = next(_collection_versions)
+
+    def _load_keyword_index(self, collection_name: str) -> BM25Index:
+        """Reopen the persisted keyword index, rebuilding it from the collection if it is missing or stale."""
+        self.keyword_index_path = None
+        if self.persist_directory:
+            self.keyword_index_path = os.path.join(self.persist_directory, f"{collection_name}_{KEYWORD_INDEX_FILE}")
+            if os.path.exists(self.keyword_index_path):
+                try:
+                    index = BM25Index.load(self.keyword_index_path)
+                except ValueError as e:
+                    print(f"Keyword index could not be reused ({e}), rebuilding it...")
+                else:
+                    if len(index) == self.collection.count():
+                        return index
+                    print("Keyword index is out of sync with the vector store, rebuilding it...")
+
+        index = BM25Index.from_collection(self.collection)
+        if self.keyword_index_path:
+            index.save(self.keyword_index_path)
+        return index
+
+    def _load_completed_files(self, collection_name: str) -> Dict[str, Optional[str]]:
+        """
+        Every stored file by name, with the hash of its fully ingested version (None while, or if,
+        its ingest is unfinished). Stores written before this was tracked derive it from the
+        metadata of their chunks.
+        """
+        self.completed_files_path = None
+        if self.persist_directory:
+            self.completed_files_path = os.path.join(self.persist_directory, f"{collection_name}_{COMPLETED_FILES_FILE}")
+            if os.path.exists(self.completed_files_path):
+                with open(self.completed_files_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+
+        completed_files = {}
+        stored = self.collection.get(include=["metadatas"])
+        for metadata in stored.get('metadatas') or []:
+            if not metadata:
+                continue
+            file_name = metadata.get('file_name') or os.path.basename(metadata.get('source', ''))
+            if file_name:
+                completed_files[file_name] = metadata.get('file_hash')
+        if completed_files:
+            self._save_completed_files(completed_files)
+        return completed_files
+
+    def _save_completed_files(self, completed_files: Dict[str, Optional[str]]):
+        if not self.completed_files_path:
+            return
+        temp_path = f"{self.completed_files_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(completed_files, f, ensure_ascii=False)
+        os.replace(temp_path, self.completed_files_path)
+
+    def mark_ingest_started(self, file_name: str):
+        """Record a file as unfinished, so it is not treated as stored until mark_ingest_complete is called."""
+        with self._completed_files_lock:
+            if file_name not in self.completed_files or self.completed_files[file_name] is not None:
+                self.completed_files[file_name] = None
+                self._save_completed_files(self.completed_files)
+
+    def mark_ingest_complete(self, file_name: str, file_hash: str):
+        """Record that every chunk of this version of a file is stored."""
+        with self._completed_files_lock:
+            self.completed_files[file_name] = file_hash
+            self._save_completed_files(self.completed_files)
+
+    @contextmanager
+    def deferred_index_saves(self) -> Iterator[None]:
+        """
+        Write the keyword index once, when the block ends, instead of after every store or delete
+        (the index is written as a whole, so per-flush saves grow with the collection). If the process
+        dies before the block ends, the saved index no longer matches the store's count and is
+        rebuilt on the next open.
+        """
+        with self._deferred_saves_lock:
+            self._deferred_saves += 1
+        try:
+            yield
+        finally:
+            with self._deferred_saves_lock:
+                self._deferred_saves -= 1
+            self._save_keyword_index()
+
+    def _save_keyword_index(self):
+        if self.keyword_index_path and not self._deferred_saves:
+            self.keyword_index.save(self.keyword_index_path)
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        """The shared embedding model, taken from the model registry on first use."""
+        if self._embedding_model is None:
+            self._embedding_model = get_embedding_model()
+        return self._embedding_model
+
+    def process_document(self, file_path: str, source_name: Optional[str] = None, batch_size: Optional[int] = None,
+                         progress_callback: Optional[Callable[[int, int], None]] = None,
+                         known_embeddings: Optional[Dict[str, np.ndarray]] = None) -> List[Dict]:
+        """
+        Load, chunk and embed a document (see load_document_chunks for source_name).
+        known_embeddings maps chunk hashes to embeddings that can be reused instead of re-encoded.
+        """
+        documents = load_document_chunks(file_path, source_name=source_name, text_splitter=self.text_splitter)
+        known_embeddings = known_embeddings or {}
+
+        # Embed every new chunk in a handful of batched forward passes instead of one per chunk
+        to_embed = [doc for doc in documents if doc['metadata']['chunk_hash'] not in known_embeddings]
+        new_embeddings = self.embed_passages(
+            [doc['content'] for doc in to_embed],
+            batch_size=batch_size,
+            progress_callback=progress_callback
+        )
+        for doc, embedding in zip(to_embed, new_embeddings):
+            doc['embedding'] = embedding
+        for doc in documents:
+            if 'embedding' not in doc:
+                doc['embedding'] = known_embeddings[doc['metadata']['chunk_hash']]
 
         return documents
-    
+
+    def find_stored_copy(self, file_hash: str, file_name: str) -> Optional[str]:
+        """
+        Check whether a file's content is already stored: returns 'unchanged' if it is stored
+        under the same name, 'duplicate' if under another name, and None otherwise.
+        Only completed ingests count, so a file whose ingest failed part way is ingested again.
+        """
+        with self._completed_files_lock:
+            completed_files = dict(self.completed_files)
+        # The chunks may have been deleted since, e.g. when the file was removed from the collection
+        if completed_files.get(file_name) == file_hash and self._has_chunks(file_name):
+            return 'unchanged'
+        if any(stored_hash == file_hash and stored_name != file_name and self._has_chunks(stored_name)
+               for stored_name, stored_hash in completed_files.items()):
+            return 'duplicate'
+        return None
+
+    def _has_chunks(self, file_name: str) -> bool:
+        return bool(self.collection.get(where={"file_name": file_name}, limit=1, include=[])['ids'])
+
+    def get_previous_chunks(self, file_name: str) -> Tuple[Dict[str, str], List[str]]:
+        """Return the stored chunk IDs of a file keyed by chunk hash, and all its stored chunk IDs."""
+        previous = self.collection.get(where={"file_name": file_name}, include=["metadatas"])
+        ids_by_hash = {
+            metadata['chunk_hash']: doc_id
+            for doc_id, metadata in zip(previous['ids'], previous['metadatas'])
+            if metadata and metadata.get('chunk_hash')
+        }
+        return ids_by_hash, previous['ids']
+
+    def reuse_stored_embeddings(self, documents: List[Dict], ids_by_hash: Dict[str, str]) -> List[Dict]:
+        """
+        Copy embeddings of already stored chunks with the same content hash onto `documents`,
+        fetching only those vectors from the store. Returns the documents that still need embedding.
+        """
+        reusable = [doc for doc in documents if doc['metadata']['chunk_hash'] in ids_by_hash]
+        if reusable:
+            stored = self.collection.get(ids=[ids_by_hash[doc['metadata']['chunk_hash']] for doc in reusable],
+                                         include=["embeddings", "metadatas"])
+            stored_embeddings = stored['embeddings'] if stored['embeddings'] is not None else []
+            # Keyed by content hash as stored now: an earlier flush of the same file may already
+            # have overwritten the old chunk under that ID with different content
+            embeddings_by_hash = {
+                metadata.get('chunk_hash'): np.asarray(embedding, dtype=np.float32)
+                for metadata, embedding in zip(stored['metadatas'], stored_embeddings)
+                if metadata
+            }
+            for doc in reusable:
+                embedding = embeddings_by_hash.get(doc['metadata']['chunk_hash'])
+                if embedding is not None:
+                    doc['embedding'] = embedding
+        return [doc for doc in documents if 'embedding' not in doc]
+
+    def ingest_document(self, file_path: str, source_name: Optional[str] = None, batch_size: Optional[int] = None,
+                        progress_callback: Optional[Callable[[int], None]] = None,
+                        flush_size: int = DEFAULT_FLUSH_SIZE) -> Dict:
+        """
+        Stream a document into the store incrementally.
+        Pages are read lazily and chunks are embedded and stored flush_size at a time,
+        so peak memory stays flat regardless of file size.
+        Files whose content is already stored are skipped, whether under the same name or another one.
+        When a stored file changes, only chunks with new content are embedded and chunks that
+        no longer exist are deleted. progress_callback, if given, receives the number of chunks
+        stored so far after each flush. Returns a summary with the status
+        ('stored', 'unchanged' or 'duplicate') and chunk counts.
+        """
+        file_name = source_name or os.path.basename(file_path)
+        summary = {'file_name': file_name, 'status': 'unchanged', 'chunks': 0, 'embedded': 0, 'removed': 0}
+
+        file_hash = compute_file_hash(file_path)
+        stored_copy = self.find_stored_copy(file_hash, file_name)
+        if stored_copy:
+            summary['status'] = stored_copy
+            return summary
+
+        self.mark_ingest_started(file_name)
+        ids_by_hash, previous_ids = self.get_previous_chunks(file_name)
+        seen_ids = set()
+        with self.deferred_index_saves():
+            for documents in batched(iter_document_chunks(file_path, source_name=file_name, text_splitter=self.text_splitter), flush_size):
+                to_embed = self.reuse_stored_embeddings(documents, ids_by_hash)
+                embeddings = self.embed_passages([doc['content'] for doc in to_embed], batch_size=batch_size)
+                for doc, embedding in zip(to_embed, embeddings):
+                    doc['embedding'] = embedding
+                self.store_documents(documents)
+
+                seen_ids.update(doc['id'] for doc in documents)
+                summary['chunks'] += len(documents)
+                summary['embedded'] += len(to_embed)
+                if progress_callback:
+                    progress_callback(summary['chunks'])
+
+            stale_ids = set(previous_ids) - seen_ids
+            self.delete_documents(list(stale_ids))
+        self.mark_ingest_complete(file_name, file_hash)
+
+        summary['status'] = 'stored'
+        summary['removed'] = len(stale_ids)
+        return summary
+
+    def embed_passages(self, texts: List[str], batch_size: Optional[int] = None,
+                       progress_callback: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """
+        Embed passages in batches and return them as a single (n, dim) matrix.
+        Passages found in the embedding cache (if one is configured) skip the model.
+        progress_callback, if given, is called as progress_callback(done, total) after each batch.
+        """
+        return encode_texts(self.embedding_model, texts, prefix="passage: ", batch_size=batch_size or self.batch_size,
+                            cache=self.embedding_cache, progress_callback=progress_callback)
+
     def store_documents(self, documents: List[Dict]):
         """Store documents in vector database."""
         if not documents:
             return
-            
-        self.collection.add(
+
+        # Upsert so that re-ingesting a changed file overwrites its existing chunk IDs
+        self.collection.upsert(
             ids=[doc['id'] for doc in documents],
-            embeddings=[doc['embedding'].tolist() for doc in documents],
+            embeddings=np.vstack([doc['embedding'] for doc in documents]),
             documents=[doc['content'] for doc in documents],
             metadatas=[doc['metadata'] for doc in documents]
-        )
\ No newline at end of file
+        )
+        self.keyword_index.add_documents([doc['id'] for doc in documents], [doc['content'] for doc in documents],
+                                         [doc['metadata'] for doc in documents])
+        self.collection_version = next(_collection_versions)
+        self._save_keyword_index()
+
+    def delete_documents(self, ids: List[str]):
+        """Remove chunks from the vector database and the keyword index."""
+        if not ids:
+            return
+
+        self.collection.delete(ids=ids)
+        self.keyword_index.remove_documents(ids)
+        self.collection_version = next(_collection_versions)
+        self._save_keyword_index()
+
+    def list_stored_files(self) -> Set[str]:
+        """Return the names of all files stored in the collection, including any whose ingest is unfinished."""
+        with self._completed_files_lock:
+            return set(self.completed_files)
+
+    def delete_file(self, file_name: str):
+        """Remove every chunk of a file, and the file from the record of stored files."""
+        _, ids = self.get_previous_chunks(file_name)
+        self.delete_documents(ids)
+        with self._completed_files_lock:
+            if file_name in self.completed_files:
+                del self.completed_files[file_name]
+                self._save_completed_files(self.completed_files)
+
+    def drop(self):
+        """Delete the collection, its persisted keyword index and its record of ingested files."""
+        with self._completed_files_lock:
+            self.completed_files = {}
+            if self.completed_files_path and os.path.exists(self.completed_files_path):
+                os.remove(self.completed_files_path)
+        self.collection.drop()
+        self.keyword_index = BM25Index()
+        self.collection_version = next(_collection_versions)
+        if self.keyword_index_path and os.path.exists(self.keyword_index_path):
+            os.remove(self.keyword_index_path)
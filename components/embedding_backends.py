@@ -0,0 +1,85 @@
+import os
+import re
+import time
+from typing import Callable, Dict, List
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# Exported ONNX models are kept here, one subdirectory per model, so the export runs only once
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join(".cache", "onnx"))
+# onnxruntime dynamic quantization target: "avx512_vnni" is fastest on recent Xeons, "avx2" runs everywhere
+ONNX_QUANTIZATION_CONFIG = os.environ.get("ONNX_QUANTIZATION_CONFIG", "avx2")
+QUANTIZED_ONNX_FILE = os.path.join("onnx", "model_qint8.onnx")
+
+def _load_torch(model_name: str) -> SentenceTransformer:
+    return SentenceTransformer(model_name)
+
+def _load_torch_int8(model_name: str) -> SentenceTransformer:
+    """fp32 PyTorch model with every Linear layer dynamically quantized to int8."""
+    import torch
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _onnx_export_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, re.sub(r'[^\w.-]+', '_', model_name))
+
+def _load_onnx(model_name: str) -> SentenceTransformer:
+    """ONNX Runtime model, exported from the PyTorch weights on first use."""
+    export_dir = _onnx_export_dir(model_name)
+    try:
+        if os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+            return SentenceTransformer(export_dir, backend="onnx")
+        model = SentenceTransformer(model_name, backend="onnx")
+    except ImportError as e:
+        raise ImportError("The onnx embedding backends need sentence-transformers>=3.2 and optimum[onnxruntime].") from e
+    model.save(export_dir)
+    return model
+
+def _load_onnx_int8(model_name: str) -> SentenceTransformer:
+    """ONNX Runtime model with int8 dynamically quantized weights."""
+    export_dir = _onnx_export_dir(model_name)
+    if not os.path.exists(os.path.join(export_dir, QUANTIZED_ONNX_FILE)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        export_dynamic_quantized_onnx_model(_load_onnx(model_name), ONNX_QUANTIZATION_CONFIG, export_dir, file_suffix="qint8")
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": QUANTIZED_ONNX_FILE})
+
+# Backend name -> loader. Every loader returns an object with the SentenceTransformer encode() API,
+# so the rest of the pipeline does not care which runtime produced the vectors.
+EMBEDDING_BACKENDS: Dict[str, Callable[[str], SentenceTransformer]] = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+
+def register_embedding_backend(name: str, loader: Callable[[str], SentenceTransformer]):
+    """Make another runtime selectable through EMBEDDING_BACKEND / get_embedding_model(backend=...)."""
+    EMBEDDING_BACKENDS[name] = loader
+
+def load_embedding_model(model_name: str, backend: str) -> SentenceTransformer:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Available: {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend](model_name)
+
+def check_parity(reference: SentenceTransformer, candidate: SentenceTransformer, texts: List[str],
+                 batch_size: int = 32) -> Dict[str, float]:
+    """
+    Compare a candidate backend against the fp32 reference on the same texts: cosine similarity
+    of each pair of embeddings, and the encoding time of both models.
+    """
+    timings = {}
+    embeddings = {}
+    for name, model in (("reference", reference), ("candidate", candidate)):
+        start = time.perf_counter()
+        embeddings[name] = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        timings[name] = time.perf_counter() - start
+
+    cosine = np.sum(embeddings["reference"] * embeddings["candidate"], axis=1)
+    return {
+        'texts': len(texts),
+        'mean_cosine': float(cosine.mean()),
+        'min_cosine': float(cosine.min()),
+        'reference_seconds': timings["reference"],
+        'candidate_seconds': timings["candidate"],
+        'speedup': timings["reference"] / timings["candidate"] if timings["candidate"] else 0.0,
+    }
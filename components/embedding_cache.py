@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Callable, List, Optional
+import numpy as np
+from .metrics import pipeline_metrics
+
+DATABASE_FILE = "embeddings.sqlite3"
+# Over-limit entries are purged every this many insertions
+EVICTION_INTERVAL = 1000
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC-normalized with collapsed whitespace."""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+class EmbeddingCache:
+    """
+    Disk-backed LRU cache of embeddings for a single model.
+    Vectors are float32 blobs in a SQLite database in `directory`; beyond max_entries the least
+    recently used are dropped. Keys are hashes of (model name, prefix, normalized text), so
+    'passage: ' and 'query: ' embeddings of the same text are cached separately.
+    Every insertion is committed, and SQLite serializes writers, so several processes
+    (ingestion workers, app and service instances) can share one cache directory.
+    """
+
+    def __init__(self, directory: str, model_name: str, max_entries: int = 100_000):
+        self.directory = directory
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = os.path.join(directory, DATABASE_FILE)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # WAL lets readers in other processes carry on while one process writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str, prefix: str) -> str:
+        raw = f"{self.model_name}\0{prefix}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def get_many(self, texts: List[str], prefix: str) -> List[Optional[np.ndarray]]:
+        """Look up embeddings; missing entries are returned as None."""
+        keys = [self._key(text, prefix) for text in texts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).copy()
+            if found:
+                self._connection.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                             [(now, key) for key in found])
+                self._connection.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in results)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return results
+
+    def put_many(self, texts: List[str], prefix: str, vectors: np.ndarray):
+        """Insert embeddings, evicting the least recently used entries when full."""
+        now = time.time()
+        rows = [
+            (self._key(text, prefix), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._puts_since_eviction += len(rows)
+            if self._puts_since_eviction >= EVICTION_INTERVAL:
+                self._connection.execute(
+                    """DELETE FROM embeddings WHERE key IN (
+                        SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,)
+                )
+                self._puts_since_eviction = 0
+            self._connection.commit()
+
+def encode_texts(model, texts: List[str], prefix: str, batch_size: int = 32,
+                 cache: Optional[EmbeddingCache] = None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+    """
+    Embed `prefix + text` for each text in batches and return a single (n, dim) matrix.
+    With a cache, only texts that are not cached go through the model.
+    progress_callback, if given, is called as progress_callback(done, total) after each batch.
+    """
+    total = len(texts)
+    if total == 0:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    cached = cache.get_many(texts, prefix) if cache is not None else [None] * total
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    done = total - len(missing)
+
+    for start in range(0, len(missing), batch_size):
+        batch_indices = missing[start:start + batch_size]
+        batch_texts = [texts[i] for i in batch_indices]
+        with pipeline_metrics.span("embedding"):
+            vectors = model.encode([f"{prefix}{text}" for text in batch_texts], batch_size=batch_size, convert_to_numpy=True)
+        if cache is not None:
+            cache.put_many(batch_texts, prefix, vectors)
+        for i, vector in zip(batch_indices, vectors):
+            cached[i] = vector
+        done += len(batch_indices)
+        if progress_callback:
+            progress_callback(done, total)
+
+    if progress_callback and not missing:
+        progress_callback(total, total)
+    return np.vstack(cached).astype(np.float32, copy=False)
@@ -0,0 +1,93 @@
+import json
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limiting and "model is loading / overloaded"
+RETRY_STATUS_CODES = (429, 503)
+
+class StreamInterrupted(Exception):
+    """A streamed generation failed, possibly after some tokens were already delivered; message is shown to the user."""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+class PooledHTTPClient:
+    """
+    requests.Session wrapper for calling inference endpoints.
+    Connections are pooled and kept alive across calls, at most max_concurrency requests
+    are in flight at once, and 429/503 responses and connection errors are retried with
+    exponentially growing, fully jittered delays (honouring Retry-After when present).
+    """
+
+    def __init__(self, pool_size: int = 10, max_concurrency: int = 8, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, timeout: tuple = (5, 60)):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _send(self, url: str, headers: Dict, payload: Dict, stream: bool) -> requests.Response:
+        """POST with retries; the caller must hold the concurrency semaphore."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout, stream=stream)
+            except requests.exceptions.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            delay = self._retry_delay(attempt, response)
+            print(f"HTTP {response.status_code} from {url}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            response.close()
+            time.sleep(delay)
+
+    def post(self, url: str, headers: Dict, payload: Dict) -> requests.Response:
+        """POST a JSON payload and return the fully read response."""
+        with self._semaphore:
+            response = self._send(url, headers, payload, stream=False)
+            # Read the body while holding the slot so the connection goes back to the pool
+            response.content
+            return response
+
+    def stream_events(self, url: str, headers: Dict, payload: Dict) -> Iterator[Dict]:
+        """
+        POST a JSON payload and yield the JSON objects of a server-sent event stream as they arrive.
+        A non-200 response raises requests.HTTPError (after retries); an event that is not valid
+        JSON (e.g. a line cut off mid-stream) raises StreamInterrupted.
+        """
+        with self._semaphore:
+            response = self._send(url, headers, payload, stream=True)
+            with response:
+                response.raise_for_status()
+                for raw_line in response.iter_lines():
+                    line = raw_line.decode('utf-8')
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError as e:
+                        raise StreamInterrupted(f"Malformed server-sent event: {data[:100]!r}") from e
+                    yield event
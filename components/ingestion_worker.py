@@ -0,0 +1,238 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from .document_processor import (DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_SIZE, DocumentProcessor, batched,
+                                 compute_file_hash, iter_document_chunks)
+from .embedding_cache import EmbeddingCache, encode_texts
+from .model_registry import DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKEND, get_embedding_model
+
+# Job lifecycle: queued -> parsing -> embedding -> stored, or skipped / failed
+JOB_STATUSES = ("queued", "parsing", "embedding", "stored", "skipped", "failed")
+# Embedded batches a worker may send ahead of the parent storing them; together with the flush
+# size this bounds the chunks a job holds in memory at once
+MAX_QUEUED_BATCHES = 4
+# How often the parent checks whether a worker that has sent nothing for a while has failed
+QUEUE_POLL_SECONDS = 1.0
+
+_worker_caches: Dict[str, EmbeddingCache] = {}
+
+def _init_worker(model_name: str, backend: str, torch_threads: int):
+    """Runs once in each worker process: split the cores between workers and load the model."""
+    import torch
+    torch.set_num_threads(torch_threads)
+    get_embedding_model(model_name, backend)
+
+def _stream_in_worker(file_path: str, file_name: str, model_name: str, backend: str, batch_size: int,
+                      flush_size: int, reusable_hashes: Set[str], cache_directory: Optional[str],
+                      cache_name: Optional[str], batches: "queue.Queue", stop: threading.Event) -> int:
+    """
+    Parse a document page by page and put its chunks on `batches` flush_size at a time, embedded,
+    followed by None once the document is done. Chunks whose hash is in reusable_hashes are sent
+    without an embedding (the parent copies the stored one); the others are looked up in the shared
+    on-disk embedding cache before going through the model. Stops early once `stop` is set
+    (the parent gave up on the job). Returns the number of chunks sent.
+    """
+    model = get_embedding_model(model_name, backend)
+    cache = None
+    if cache_directory:
+        cache = _worker_caches.get(cache_directory)
+        if cache is None:
+            cache = _worker_caches[cache_directory] = EmbeddingCache(cache_directory, cache_name)
+
+    total = 0
+    for documents in batched(iter_document_chunks(file_path, source_name=file_name), flush_size):
+        if stop.is_set():
+            return total
+        to_embed = [doc for doc in documents if doc['metadata']['chunk_hash'] not in reusable_hashes]
+        embeddings = encode_texts(model, [doc['content'] for doc in to_embed], prefix="passage: ",
+                                  batch_size=batch_size, cache=cache)
+        for doc, embedding in zip(to_embed, embeddings):
+            doc['embedding'] = embedding
+        # Waits while MAX_QUEUED_BATCHES batches are queued, so parsing never runs far ahead of storing
+        while True:
+            try:
+                batches.put(documents, timeout=QUEUE_POLL_SECONDS)
+                break
+            except queue.Full:
+                if stop.is_set():
+                    return total
+        total += len(documents)
+    batches.put(None)
+    return total
+
+class IngestionJob:
+    def __init__(self, file_path: str, file_name: str, delete_file: bool, doc_processor: DocumentProcessor):
+        self.id = uuid.uuid4().hex
+        self.doc_processor = doc_processor
+        self.file_path = file_path
+        self.file_name = file_name
+        self.delete_file = delete_file
+        self.status = "queued"
+        self.total_chunks = 0
+        self.stored_chunks = 0
+        self.summary: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("stored", "skipped", "failed")
+
+class IngestionQueue:
+    """
+    Background ingestion: documents are parsed and embedded in a pool of worker processes
+    while the caller carries on. A worker streams its file page by page and hands the chunks
+    over in batches of flush_size as they are embedded; each batch is stored right away, so a
+    document becomes searchable while it is still being ingested and neither process ever
+    holds the whole document. Storing and the change detection of DocumentProcessor.ingest_document
+    stay in this process; workers only do the CPU-heavy parsing and model inference.
+    One queue can serve several collections (e.g. one per tenant): submit() takes the
+    DocumentProcessor to store into, defaulting to the one given here.
+    """
+
+    def __init__(self, doc_processor: Optional[DocumentProcessor] = None, max_workers: int = 2,
+                 model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: Optional[int] = None,
+                 max_finished_jobs: int = 100, backend: Optional[str] = None,
+                 flush_size: int = DEFAULT_FLUSH_SIZE):
+        self.doc_processor = doc_processor
+        self.flush_size = flush_size
+        self.max_finished_jobs = max_finished_jobs
+        self.model_name = model_name
+        self.backend = backend or EMBEDDING_BACKEND
+        self.batch_size = batch_size or (doc_processor.batch_size if doc_processor else DEFAULT_BATCH_SIZE)
+        torch_threads = max(1, (os.cpu_count() or 1) // max_workers)
+        # spawn rather than fork: forking a process that has already loaded torch can deadlock
+        context = multiprocessing.get_context("spawn")
+        self._process_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_name, self.backend, torch_threads)
+        )
+        # Serves the queues workers send their embedded batches back on
+        self._manager = context.Manager()
+        # One coordinating thread per in-flight job; it waits on the process pool
+        self._coordinators = ThreadPoolExecutor(max_workers=max_workers * 2, thread_name_prefix="ingestion")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, source_name: Optional[str] = None, delete_file: bool = False,
+               doc_processor: Optional[DocumentProcessor] = None) -> IngestionJob:
+        """Queue a file for ingestion; with delete_file, the file is removed once the job ends."""
+        doc_processor = doc_processor or self.doc_processor
+        if doc_processor is None:
+            raise ValueError("No DocumentProcessor to store the document in")
+        job = IngestionJob(file_path, source_name or os.path.basename(file_path), delete_file, doc_processor)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs so the job table stays bounded
+            finished = [job_id for job_id, queued_job in self._jobs.items() if queued_job.done]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
+        self._coordinators.submit(self._run_job, job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, doc_processor: Optional[DocumentProcessor] = None) -> List[IngestionJob]:
+        """All tracked jobs, or only those storing into doc_processor."""
+        with self._lock:
+            return [job for job in self._jobs.values() if doc_processor is None or job.doc_processor is doc_processor]
+
+    def has_pending(self, doc_processor: DocumentProcessor) -> bool:
+        """Whether any unfinished job still writes to doc_processor."""
+        return any(not job.done for job in self.jobs(doc_processor))
+
+    def shutdown(self, wait: bool = True):
+        self._coordinators.shutdown(wait=wait)
+        self._process_pool.shutdown(wait=wait)
+        self._manager.shutdown()
+
+    def _run_job(self, job: IngestionJob):
+        try:
+            self._ingest(job)
+        except Exception as e:
+            print(f"Error ingesting {job.file_name}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            if job.delete_file and os.path.exists(job.file_path):
+                os.unlink(job.file_path)
+
+    def _ingest(self, job: IngestionJob):
+        processor = job.doc_processor
+        file_hash = compute_file_hash(job.file_path)
+        stored_copy = processor.find_stored_copy(file_hash, job.file_name)
+        if stored_copy:
+            job.summary = {'file_name': job.file_name, 'status': stored_copy, 'chunks': 0, 'embedded': 0, 'removed': 0}
+            job.status = "skipped"
+            return
+
+        processor.mark_ingest_started(job.file_name)
+        job.status = "parsing"
+        # Reuse embeddings from the previous version of the file; the worker skips embedding those chunks
+        ids_by_hash, previous_ids = processor.get_previous_chunks(job.file_name)
+        cache = processor.embedding_cache
+        batches = self._manager.Queue(maxsize=MAX_QUEUED_BATCHES)
+        stop = self._manager.Event()
+        future = self._process_pool.submit(
+            _stream_in_worker, job.file_path, job.file_name, self.model_name, self.backend, self.batch_size,
+            self.flush_size, set(ids_by_hash), cache.directory if cache is not None else None,
+            cache.model_name if cache is not None else None, batches, stop
+        )
+
+        seen_ids = set()
+        embedded = 0
+        with processor.deferred_index_saves():
+            try:
+                while True:
+                    try:
+                        documents = batches.get(timeout=QUEUE_POLL_SECONDS)
+                    except queue.Empty:
+                        if future.done():
+                            # Raises the worker's error; after a success the end marker is still queued
+                            future.result()
+                        continue
+                    if documents is None:
+                        break
+
+                    job.status = "embedding"
+                    job.total_chunks += len(documents)
+                    to_embed = processor.reuse_stored_embeddings(
+                        [doc for doc in documents if 'embedding' not in doc], ids_by_hash
+                    )
+                    # Rare: the stored chunk was overwritten with other content by an earlier batch
+                    if to_embed:
+                        for doc, embedding in zip(to_embed, processor.embed_passages([doc['content'] for doc in to_embed])):
+                            doc['embedding'] = embedding
+                    processor.store_documents(documents)
+                    seen_ids.update(doc['id'] for doc in documents)
+                    embedded += sum(doc['metadata']['chunk_hash'] not in ids_by_hash for doc in documents) + len(to_embed)
+                    job.stored_chunks += len(documents)
+            except BaseException:
+                # Otherwise a worker blocked on the full queue would hold its pool slot forever
+                stop.set()
+                raise
+
+            stale_ids = set(previous_ids) - seen_ids
+            processor.delete_documents(list(stale_ids))
+        processor.mark_ingest_complete(job.file_name, file_hash)
+
+        job.summary = {
+            'file_name': job.file_name,
+            'status': 'stored',
+            'chunks': job.stored_chunks,
+            'embedded': embedded,
+            'removed': len(stale_ids),
+        }
+        job.status = "stored"
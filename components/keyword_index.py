@@ -0,0 +1,180 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Word characters plus the Indic script blocks (Devanagari .. Sinhala), whose vowel signs
+# and viramas are combining marks that \w alone would split words on. The dandas are excluded.
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u0963\u0966-\u0DFF]+")
+# Chunk metadata fields kept in the index so searches can be restricted to matching documents
+FILTER_FIELDS = ("file_name", "source", "page", "language")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Incrementally maintained inverted index with Okapi BM25 scoring.
+    A query only touches the posting lists of its own terms, so its cost grows
+    with how common those terms are rather than with the size of the corpus.
+    The FILTER_FIELDS of each document's metadata are indexed as well, so a filtered
+    search only scores documents in the matching subset.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.doc_fields: Dict[str, Dict[str, Any]] = {}
+        self.field_values: Dict[str, Dict[Any, Set[str]]] = {}
+        self.total_length = 0
+        # Number of (term, document) postings, kept up to date so the index's size is known without a scan
+        self.total_postings = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_documents(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None):
+        """Index documents, replacing any previously indexed document with the same ID."""
+        with self._lock:
+            for i, (doc_id, text) in enumerate(zip(ids, texts)):
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+                term_counts = Counter(tokenize(text))
+                for term, count in term_counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+                length = sum(term_counts.values())
+                self.doc_terms[doc_id] = list(term_counts)
+                self.total_postings += len(term_counts)
+                self.doc_lengths[doc_id] = length
+                self.total_length += length
+                metadata = (metadatas[i] if metadatas else None) or {}
+                self._index_fields(doc_id, {field: metadata[field] for field in FILTER_FIELDS if field in metadata})
+
+    def _index_fields(self, doc_id: str, fields: Dict[str, Any]):
+        self.doc_fields[doc_id] = fields
+        for field, value in fields.items():
+            self.field_values.setdefault(field, {}).setdefault(value, set()).add(doc_id)
+
+    def remove_documents(self, ids: List[str]):
+        """Drop documents from the index; unknown IDs are ignored."""
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id)
+        self.total_postings -= len(terms)
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for field, value in self.doc_fields.pop(doc_id, {}).items():
+            matching = self.field_values[field][value]
+            matching.discard(doc_id)
+            if not matching:
+                del self.field_values[field][value]
+
+    def matching_ids(self, filters: Dict[str, Any]) -> Set[str]:
+        """
+        IDs of documents matching every field of `filters`; a field's value may be a single
+        value or a list of accepted values.
+        """
+        with self._lock:
+            matching: Optional[Set[str]] = None
+            for field, accepted in filters.items():
+                values = accepted if isinstance(accepted, (list, tuple, set)) else [accepted]
+                field_index = self.field_values.get(field, {})
+                field_matches = set().union(*(field_index.get(value, set()) for value in values))
+                matching = field_matches if matching is None else matching & field_matches
+                if not matching:
+                    return set()
+            return matching if matching is not None else set(self.doc_lengths)
+
+    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to k (doc_id, bm25_score) pairs, best first.
+        With filters (see matching_ids), only documents in the matching subset are scored;
+        term statistics stay those of the whole corpus.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            num_docs = len(self.doc_lengths)
+            if not terms or num_docs == 0:
+                return []
+            avg_length = self.total_length / num_docs or 1.0
+            allowed = self.matching_ids(filters) if filters else None
+            if allowed is not None and not allowed:
+                return []
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                if allowed is not None:
+                    # Walk whichever side is smaller: the posting list or the filtered subset
+                    if len(allowed) < len(docs):
+                        docs = {doc_id: docs[doc_id] for doc_id in allowed if doc_id in docs}
+                    else:
+                        docs = {doc_id: tf for doc_id, tf in docs.items() if doc_id in allowed}
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        """Write the index to a JSON file (atomically, via a temp file)."""
+        with self._lock:
+            data = {
+                'k1': self.k1,
+                'b': self.b,
+                'postings': self.postings,
+                'doc_lengths': self.doc_lengths,
+                'doc_fields': self.doc_fields,
+            }
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load an index written by save(); raises ValueError for files written before metadata fields were indexed."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if 'doc_fields' not in data:
+            raise ValueError("keyword index has no metadata fields")
+        index = cls(k1=data['k1'], b=data['b'])
+        index.postings = data['postings']
+        index.doc_lengths = data['doc_lengths']
+        for term, docs in index.postings.items():
+            for doc_id in docs:
+                index.doc_terms.setdefault(doc_id, []).append(term)
+        index.total_length = sum(index.doc_lengths.values())
+        index.total_postings = sum(len(docs) for docs in index.postings.values())
+        for doc_id, fields in data['doc_fields'].items():
+            index._index_fields(doc_id, fields)
+        return index
+
+    @classmethod
+    def from_collection(cls, collection) -> "BM25Index":
+        """Build an index from every document currently in a vector store (or Chroma collection)."""
+        index = cls()
+        stored = collection.get(include=["documents", "metadatas"])
+        if stored and stored.get('ids'):
+            index.add_documents(stored['ids'], stored['documents'], stored['metadatas'])
+        return index
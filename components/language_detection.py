@@ -0,0 +1,37 @@
+from bisect import bisect_right
+from collections import Counter
+
+# Unicode script blocks and the language code (as used by the Sarvam API) they are attributed to.
+# Detection is by script, so languages sharing one (e.g. Hindi and Marathi in Devanagari) are not told apart.
+SCRIPT_LANGUAGES = [
+    (0x0041, 0x005A, "en-IN"),
+    (0x0061, 0x007A, "en-IN"),
+    (0x00C0, 0x024F, "en-IN"),
+    (0x0900, 0x097F, "hi-IN"),
+    (0x0980, 0x09FF, "bn-IN"),
+    (0x0A00, 0x0A7F, "pa-IN"),
+    (0x0A80, 0x0AFF, "gu-IN"),
+    (0x0B00, 0x0B7F, "od-IN"),
+    (0x0B80, 0x0BFF, "ta-IN"),
+    (0x0C00, 0x0C7F, "te-IN"),
+    (0x0C80, 0x0CFF, "kn-IN"),
+    (0x0D00, 0x0D7F, "ml-IN"),
+]
+UNKNOWN_LANGUAGE = "und"
+
+_RANGE_STARTS = [start for start, _, _ in SCRIPT_LANGUAGES]
+
+def _language_of(char: str):
+    code_point = ord(char)
+    i = bisect_right(_RANGE_STARTS, code_point) - 1
+    if i >= 0 and code_point <= SCRIPT_LANGUAGES[i][1]:
+        return SCRIPT_LANGUAGES[i][2]
+    return None
+
+def detect_language(text: str, sample_chars: int = 2000) -> str:
+    """Language of the script most letters in the text are written in, or 'und' if none is recognised."""
+    counts = Counter(_language_of(char) for char in text[:sample_chars] if not char.isspace())
+    counts.pop(None, None)
+    if not counts:
+        return UNKNOWN_LANGUAGE
+    return counts.most_common(1)[0][0]
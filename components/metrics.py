@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class LatencyHistogram:
+    """Cumulative bucket counts for export, plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, upper_bound in enumerate(self.buckets):
+            if seconds <= upper_bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, q: float) -> float:
+        """q-th percentile (0-100) of the recent samples."""
+        if not self.recent:
+            return 0.0
+        samples = sorted(self.recent)
+        index = min(len(samples) - 1, max(0, round(q / 100 * len(samples)) - 1))
+        return samples[index]
+
+class LatencyRecorder:
+    """
+    Thread-safe per-stage latency recorder for the RAG pipeline.
+    Stages are timed with `with recorder.span("stage"):` and can be exported
+    in Prometheus text format or as JSON lines.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block and record it under `stage`, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count, mean, p50, p95 and p99 in seconds."""
+        with self._lock:
+            return {
+                stage: {
+                    'count': histogram.count,
+                    'mean': histogram.total / histogram.count if histogram.count else 0.0,
+                    'p50': histogram.percentile(50),
+                    'p95': histogram.percentile(95),
+                    'p99': histogram.percentile(99),
+                }
+                for stage, histogram in sorted(self._histograms.items())
+            }
+
+    def to_prometheus(self, metric_name: str = "rag_stage_latency_seconds") -> str:
+        """Render all stages as one Prometheus histogram labelled by stage."""
+        lines = [
+            f"# HELP {metric_name} Latency of RAG pipeline stages in seconds.",
+            f"# TYPE {metric_name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                for upper_bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'{metric_name}_bucket{{stage="{stage}",le="{upper_bound}"}} {count}')
+                lines.append(f'{metric_name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric_name}_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'{metric_name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self) -> str:
+        """One JSON object per stage with a timestamp and the summary statistics."""
+        timestamp = time.time()
+        return "".join(
+            json.dumps({'timestamp': timestamp, 'stage': stage, **stats}) + "\n"
+            for stage, stats in self.summary().items()
+        )
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+# Process-wide recorder shared by all pipeline components
+pipeline_metrics = LatencyRecorder()
@@ -0,0 +1,53 @@
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+from sentence_transformers import SentenceTransformer
+from .embedding_cache import EmbeddingCache
+from .embedding_backends import load_embedding_model
+
+DEFAULT_EMBEDDING_MODEL = 'intfloat/multilingual-e5-base'
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+# Inference runtime for the embedding model: torch (fp32), torch-int8, onnx or onnx-int8
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+_models: Dict[Tuple[str, str], SentenceTransformer] = {}
+_caches: Dict[str, EmbeddingCache] = {}
+_lock = threading.Lock()
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: Optional[str] = None) -> SentenceTransformer:
+    """
+    Return the process-wide instance of an embedding model, loading it on first use.
+    Every component asking for the same model name and backend gets the same object, so the
+    weights are held in memory (and loaded from disk) only once per process.
+    backend defaults to the EMBEDDING_BACKEND environment variable.
+    """
+    key = (model_name, backend or EMBEDDING_BACKEND)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have finished loading while we waited for the lock
+        model = _models.get(key)
+        if model is None:
+            print(f"Loading embedding model '{model_name}' ({key[1]} backend)...")
+            model = load_embedding_model(*key)
+            _models[key] = model
+        return model
+
+def get_embedding_cache(model_name: str = DEFAULT_EMBEDDING_MODEL, directory: str = EMBEDDING_CACHE_DIR,
+                        backend: Optional[str] = None) -> EmbeddingCache:
+    """
+    Return the process-wide on-disk embedding cache for a model, one subdirectory per model.
+    Quantized backends produce slightly different vectors, so each non-default backend gets its own cache.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    cache_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+    cache_directory = os.path.join(directory, re.sub(r'[^\w.-]+', '_', cache_name))
+    with _lock:
+        cache = _caches.get(cache_directory)
+        if cache is None:
+            cache = EmbeddingCache(cache_directory, cache_name)
+            _caches[cache_directory] = cache
+        return cache
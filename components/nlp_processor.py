@@ -1,11 +1,21 @@
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from sarvamai import SarvamAI
+from .translation_cache import TranslationCache
+from .metrics import pipeline_metrics
 
 class NLPProcessor:
-    def __init__(self):
-        """Initializes the NLP Processor using the official SarvamAI SDK."""
+    def __init__(self, translation_cache: Optional[TranslationCache] = None, max_concurrent_requests: int = 4,
+                 api_key: Optional[str] = None):
+        """
+        Initializes the NLP Processor using the official SarvamAI SDK.
+        The API key is read from the Streamlit secrets unless given explicitly.
+        """
+        self.translation_cache = translation_cache
+        self.max_concurrent_requests = max_concurrent_requests
         try:
-            self.client = SarvamAI(api_subscription_key=st.secrets["SARVAM_API_KEY"])
+            self.client = SarvamAI(api_subscription_key=api_key or st.secrets["SARVAM_API_KEY"])
         except Exception as e:
             self.client = None
             st.error(f"Failed to initialize Sarvam AI client: {e}")
@@ -13,26 +23,77 @@ class NLPProcessor:
     def translate_text(self, text: str, target_lang: str, source_lang: str = "auto") -> str:
         """
         Translate text using the official Sarvam AI SDK.
+        Successful translations are served from and stored in the translation cache, if configured.
         """
         if not self.client or not text or not text.strip():
             return text
         if source_lang == target_lang and source_lang != "auto":
             return text
 
+        if self.translation_cache is not None:
+            cached = self.translation_cache.get(text, target_lang, source_lang)
+            if cached is not None:
+                return cached
+
+        translated = self._call_translate_api(text, target_lang, source_lang)
+        if translated is None:
+            return text
+        if self.translation_cache is not None:
+            self.translation_cache.put(text, translated, target_lang, source_lang)
+        return translated
+
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = "auto") -> List[str]:
+        """
+        Translate many strings at once, returning translations in input order.
+        Duplicates are translated once and cached strings are looked up in a single query.
+        The Sarvam translate endpoint takes one input per request, so the remaining
+        strings are sent as concurrent requests (at most max_concurrent_requests at a time).
+        """
+        if not self.client or (source_lang == target_lang and source_lang != "auto"):
+            return list(texts)
+        pending = [text for text in dict.fromkeys(texts) if text and text.strip()]
+        translations = {}
+        if self.translation_cache is not None:
+            translations = self.translation_cache.get_many(pending, target_lang, source_lang)
+        pending = [text for text in pending if text not in translations]
+
+        if pending:
+            # Misses go straight to the API: translate_text would look each one up in the cache again
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+                results = executor.map(lambda text: self._call_translate_api(text, target_lang, source_lang), pending)
+                for text, translated in zip(pending, results):
+                    if translated is None:
+                        continue
+                    translations[text] = translated
+                    if self.translation_cache is not None:
+                        self.translation_cache.put(text, translated, target_lang, source_lang)
+
+        return [translations.get(text, text) for text in texts]
+
+    def warm_cache(self, texts: List[str], target_langs: List[str], source_lang: str = "en-IN"):
+        """Pre-translate fixed strings (UI and fallback messages) into every target language."""
+        if self.translation_cache is None:
+            return
+        for target_lang in target_langs:
+            self.translate_batch(texts, target_lang, source_lang)
+
+    def _call_translate_api(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Single Sarvam SDK call; returns None on failure so errors are never cached."""
         try:
             print(f"--- Calling Sarvam Translate SDK ---")
             print(f"Input: '{text[:50]}...', Source: {source_lang}, Target: {target_lang}")
 
-            response = self.client.text.translate(
-                input=text,
-                source_language_code=source_lang,
-                target_language_code=target_lang,
-            )
-            
+            with pipeline_metrics.span("translation"):
+                response = self.client.text.translate(
+                    input=text,
+                    source_language_code=source_lang,
+                    target_language_code=target_lang,
+                )
+
             print(f"Sarvam Translate SDK Response: {response}")
-            
+
             return response.translated_text
 
         except Exception as e:
             print(f"ERROR in Sarvam SDK for translation: {e}")
-            return text
\ No newline at end of file
+            return None
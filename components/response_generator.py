@@ -1,48 +1,151 @@
 import requests
 import os
+import time
+from typing import Callable, Iterator, Optional
+import numpy as np
 import streamlit as st
 from .nlp_processor import NLPProcessor
+from .http_client import PooledHTTPClient, StreamInterrupted
+from .answer_cache import SemanticAnswerCache
+from .chunk_merging import deduplicate_chunks
+from .context_packing import PACKING_STRATEGIES, get_token_counter, pack_context
+from .metrics import pipeline_metrics
 
 API_URL = "https://api-inference.huggingface.co/models/mistralai/Mixtral-8x7B-Instruct-v0.1"
+# Tokenizer used to measure the context (a Hub name or a local directory); empty to estimate from text length
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "mistralai/Mixtral-8x7B-Instruct-v0.1")
+# Tokens of retrieved text sent per LLM call, and how chunks are chosen to fill them: greedy or knapsack
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_PACKING = os.environ.get("CONTEXT_PACKING", "greedy")
+MODEL_CONTEXT_WINDOW = 32768
+MAX_NEW_TOKENS = 350
 
+MODEL_LOADING_MESSAGE = "The AI model is currently loading. This can take up to a minute. Please ask your question again shortly."
+API_ERROR_MESSAGE = "I encountered an error while trying to reach the AI model. Please check the terminal logs."
+CONNECTION_ERROR_MESSAGE = "I could not connect to the Hugging Face Inference API. Please check your internet connection."
+NO_RESPONSE_MESSAGE = "I could not generate a response based on the provided documents."
+# Failure responses are never put in the answer cache
+ERROR_RESPONSES = {MODEL_LOADING_MESSAGE, API_ERROR_MESSAGE, CONNECTION_ERROR_MESSAGE, NO_RESPONSE_MESSAGE}
 class ResponseGenerator:
-    def __init__(self):
-        try:
-            hf_token = st.secrets["HF_TOKEN"]
+    def __init__(self, api_url: str = API_URL, hf_token: Optional[str] = None,
+                 http_client: Optional[PooledHTTPClient] = None, answer_cache: Optional[SemanticAnswerCache] = None,
+                 context_token_budget: int = CONTEXT_TOKEN_BUDGET, packing: str = CONTEXT_PACKING,
+                 truncate_sentences: bool = True, tokenizer_name: Optional[str] = CONTEXT_TOKENIZER):
+        """
+        api_url and hf_token can be overridden (e.g. to point at a local stub server);
+        by default the token is read from the Streamlit secrets.
+        The context holds at most context_token_budget tokens of retrieved text, measured with the
+        tokenizer_name tokenizer (loaded on first use) and packed by the given strategy (see context_packing).
+        """
+        if packing not in PACKING_STRATEGIES:
+            raise ValueError(f"Unknown packing strategy '{packing}'. Available: {', '.join(PACKING_STRATEGIES)}")
+        self.api_url = api_url
+        self.answer_cache = answer_cache
+        self.http_client = http_client or PooledHTTPClient()
+        self.context_token_budget = context_token_budget
+        self.packing = packing
+        self.truncate_sentences = truncate_sentences
+        self.tokenizer_name = tokenizer_name
+        self._count_tokens = None
+        self.hf_token = hf_token
+        if hf_token is not None:
             self.headers = {"Authorization": f"Bearer {hf_token}"}
+            return
+        try:
+            self.hf_token = st.secrets["HF_TOKEN"]
+            self.headers = {"Authorization": f"Bearer {self.hf_token}"}
         except (FileNotFoundError, KeyError):
             self.headers = {}
             st.error("Hugging Face token not found. Please add HF_TOKEN to your secrets.")
             st.stop()
-    
-    def generate_response(self, query: str, retrieved_docs: list, nlp_processor: NLPProcessor, target_language: str = 'en-IN') -> str:
-        context = self._create_context(retrieved_docs)
-        
+
+    def generate_response(self, query: str, retrieved_docs: list, nlp_processor: NLPProcessor, target_language: str = 'en-IN',
+                          on_token: Optional[Callable[[str], None]] = None, query_embedding: Optional[np.ndarray] = None,
+                          collection_version: Optional[int] = None) -> str:
+        """
+        Generate an answer from the retrieved documents.
+        If on_token is given and the answer is in English, tokens are streamed to it as they arrive;
+        other languages need the complete answer before it can be translated.
+        With an answer cache, query_embedding (of the English query) and collection_version let a
+        near-identical question over the same retrieved chunks reuse an earlier answer.
+        """
+        use_cache = self.answer_cache is not None and query_embedding is not None and collection_version is not None
+        chunk_ids = [doc.get('id') for doc in retrieved_docs]
+        if use_cache:
+            cached = self.answer_cache.lookup(query_embedding, chunk_ids, collection_version)
+            if cached is not None:
+                return self._answer_from_cache(cached, nlp_processor, target_language, on_token)
+
+        # Neighbouring chunks share CHUNK_OVERLAP characters: merge them so no text is sent twice
+        context = self._create_context(deduplicate_chunks(retrieved_docs), query)
+
         if not self.headers.get("Authorization"):
             return "Cannot generate response because Hugging Face API token is missing."
 
-        english_response = self._generate_with_hf_api(query, context)
+        if on_token and target_language == 'en-IN':
+            english_response = ""
+            try:
+                for token in self._stream_with_hf_api(query, context):
+                    english_response += token
+                    on_token(token)
+            except StreamInterrupted as e:
+                # Whatever arrived before the failure is incomplete: show it with the error, never cache it
+                partial = english_response.strip()
+                return f"{partial}\n\n{e.message}" if partial else e.message
+            english_response = english_response.strip()
+        else:
+            english_response = self._generate_with_hf_api(query, context)
+
+        cached = None
+        if use_cache and english_response and english_response not in ERROR_RESPONSES:
+            cached = self.answer_cache.store(query_embedding, chunk_ids, collection_version, english_response)
 
         if target_language != 'en-IN' and english_response:
-            return nlp_processor.translate_text(english_response, source_lang='en-IN', target_lang=target_language)
-        
-        return english_response or "I could not generate a response based on the provided documents."
-    
-    def _create_context(self, docs: list, max_length: int = 4000) -> str:
-        context_parts = []
-        current_length = 0
-        for doc in docs:
-            content = doc.get('content', '')
-            if current_length + len(content) > max_length:
-                break
-            source = doc.get('metadata', {}).get('source', 'Unknown')
-            context_parts.append(f"Source: {os.path.basename(source)}\nContent: {content}\n---")
-            current_length += len(content)
-        return "\n".join(context_parts)
+            translated = nlp_processor.translate_text(english_response, source_lang='en-IN', target_lang=target_language)
+            if cached is not None and translated != english_response:
+                cached.translations[target_language] = translated
+            return translated
 
-    def _generate_with_hf_api(self, query: str, context: str) -> str:
-        """Generate response using the Hugging Face Inference API with the correct prompt format."""
-        
+        return english_response or NO_RESPONSE_MESSAGE
+
+    def _answer_from_cache(self, cached, nlp_processor: NLPProcessor, target_language: str,
+                           on_token: Optional[Callable[[str], None]]) -> str:
+        """Serve a cached answer, translating it (once) if this language has not been requested before."""
+        if target_language == 'en-IN':
+            if on_token:
+                on_token(cached.english_answer)
+            return cached.english_answer
+        translated = cached.translations.get(target_language)
+        if translated is None:
+            translated = nlp_processor.translate_text(cached.english_answer, source_lang='en-IN', target_lang=target_language)
+            if translated != cached.english_answer:
+                cached.translations[target_language] = translated
+        return translated
+
+    @property
+    def count_tokens(self):
+        """Token counter of the context tokenizer, loaded on first use."""
+        if self._count_tokens is None:
+            self._count_tokens = get_token_counter(self.tokenizer_name, self.hf_token)
+        return self._count_tokens
+
+    @staticmethod
+    def _format_context_part(doc: dict, content: str) -> str:
+        metadata = doc.get('metadata', {})
+        source = metadata.get('file_name') or os.path.basename(metadata.get('source', 'Unknown'))
+        return f"Source: {source}\nContent: {content}\n---"
+
+    def _create_context(self, docs: list, query: str = "") -> str:
+        """Pack the best retrieved chunks into the token budget, never overflowing the model's context window."""
+        with pipeline_metrics.span("context_packing"):
+            prompt_tokens = self.count_tokens(self._build_payload(query, "")["inputs"])
+            budget = min(self.context_token_budget, MODEL_CONTEXT_WINDOW - MAX_NEW_TOKENS - prompt_tokens)
+            packed = pack_context(docs, budget, self.count_tokens, self._format_context_part,
+                                  strategy=self.packing, truncate=self.truncate_sentences)
+        return "\n".join(self._format_context_part(doc, content) for doc, content in packed)
+
+    def _build_payload(self, query: str, context: str, stream: bool = False) -> dict:
+        """Build the Mixtral instruct prompt and request payload."""
         system_prompt = "You are a helpful AI assistant. Answer the user's question based *only* on the provided context. If the context does not contain the answer, state that you could not find the information in the documents. Be concise."
         user_prompt = f"""CONTEXT:
         {context}
@@ -54,26 +157,64 @@ class ResponseGenerator:
         payload = {
             "inputs": prompt,
             "parameters": {
-                "max_new_tokens": 350,
+                "max_new_tokens": MAX_NEW_TOKENS,
                 "temperature": 0.3,
                 "return_full_text": False,
             }
         }
-        
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _generate_with_hf_api(self, query: str, context: str) -> str:
+        """Generate response using the Hugging Face Inference API with the correct prompt format."""
+        payload = self._build_payload(query, context)
+
         try:
-            response = requests.post(API_URL, headers=self.headers, json=payload, timeout=60)
-            
+            with pipeline_metrics.span("llm_http"):
+                response = self.http_client.post(self.api_url, headers=self.headers, payload=payload)
+
             if response.status_code == 200:
                 result = response.json()
                 return result[0]['generated_text'].strip()
             elif response.status_code == 503:
                 st.toast("Model is loading, please wait a moment and try again...", icon="⏳")
-                return "The AI model is currently loading. This can take up to a minute. Please ask your question again shortly."
+                return MODEL_LOADING_MESSAGE
             else:
                 error_message = f"Hugging Face API Error: {response.status_code} - {response.text}"
                 print(error_message) # This will print the exact error to your terminal
-                return "I encountered an error while trying to reach the AI model. Please check the terminal logs."
+                return API_ERROR_MESSAGE
 
         except requests.exceptions.RequestException as e:
             print(f"Error calling Hugging Face API: {e}")
-            return "I could not connect to the Hugging Face Inference API. Please check your internet connection."
\ No newline at end of file
+            return CONNECTION_ERROR_MESSAGE
+
+    def _stream_with_hf_api(self, query: str, context: str) -> Iterator[str]:
+        """
+        Stream generated tokens from the Hugging Face Inference API as server-sent events.
+        Raises StreamInterrupted if the request fails, before or after the first token.
+        """
+        payload = self._build_payload(query, context, stream=True)
+        start = time.perf_counter()
+        first_token = True
+
+        try:
+            for event in self.http_client.stream_events(self.api_url, headers=self.headers, payload=payload):
+                token = event.get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    if first_token:
+                        pipeline_metrics.observe("llm_first_token", time.perf_counter() - start)
+                        first_token = False
+                    yield token["text"]
+            pipeline_metrics.observe("llm_http", time.perf_counter() - start)
+        except StreamInterrupted as e:
+            print(f"Hugging Face API Error: {e}")
+            raise StreamInterrupted(API_ERROR_MESSAGE) from e
+        except requests.exceptions.HTTPError as e:
+            print(f"Hugging Face API Error: {e}")
+            if e.response is not None and e.response.status_code == 503:
+                raise StreamInterrupted(MODEL_LOADING_MESSAGE) from e
+            raise StreamInterrupted(API_ERROR_MESSAGE) from e
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling Hugging Face API: {e}")
+            raise StreamInterrupted(CONNECTION_ERROR_MESSAGE) from e
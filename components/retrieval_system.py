@@ -1,103 +1,198 @@
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
-import re
+from .model_registry import get_embedding_model
+from .keyword_index import BM25Index, FILTER_FIELDS
+from .embedding_cache import EmbeddingCache, encode_texts, normalize_text
+from .lru_cache import LRUCache
+from .metrics import pipeline_metrics
+
+# Types a filter value (or each value of a list) may have: those of the chunk metadata
+FILTER_VALUE_TYPES = (str, int, float, bool)
+
+def filters_to_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict]:
+    """
+    Translate retrieval filters, e.g. {'file_name': ['a.pdf', 'b.pdf'], 'language': 'hi-IN'},
+    into a Chroma-style where clause: a list of values becomes $in and several fields are combined with $and.
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unsupported filter fields: {sorted(unknown)} (expected any of {list(FILTER_FIELDS)})")
+    for field, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        # Metadata values are scalars; operator dicts and other objects cannot be matched by equality
+        if not values or not all(isinstance(item, FILTER_VALUE_TYPES) for item in values):
+            raise ValueError(f"Filter '{field}' must be a string, number or boolean, or a non-empty list of them; got {value!r}")
+    clauses = [
+        {field: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else value}
+        for field, value in sorted(filters.items())
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _filters_key(filters: Optional[Dict[str, Any]]):
+    if not filters:
+        return None
+    # repr keeps types apart, so page=1 and page="1" get different keys
+    return tuple(sorted(
+        (field, tuple(sorted(map(repr, value))) if isinstance(value, (list, tuple, set)) else repr(value))
+        for field, value in filters.items()
+    ))
 
 class DocumentRetriever:
-    def __init__(self, chroma_collection):
+    def __init__(self, chroma_collection, embedding_model: Optional[SentenceTransformer] = None,
+                 keyword_index: Optional[BM25Index] = None, search_workers: int = 4,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 collection_version: Optional[Callable[[], int]] = None, max_cached_queries: int = 1024):
+        """
+        keyword_index should be the DocumentProcessor's index so that newly stored documents
+        are searchable; without one, an index is built from the collection's current contents.
+        search_workers bounds the thread pool that runs the semantic leg of hybrid_search.
+        collection_version returns a counter that changes whenever the collection is written
+        (e.g. lambda: doc_processor.collection_version); hybrid_search results are only cached
+        when it is given, since otherwise stale results could not be detected.
+        Every search method takes optional filters on the chunk metadata (see filters_to_where);
+        they are applied before scoring in both the vector store and the keyword index.
+        """
         self.collection = chroma_collection
-        self.embedding_model = SentenceTransformer('intfloat/multilingual-e5-base')
-
-    def similarity_search(self, query: str, k: int = 5) -> List[Dict]:
-        """Perform similarity search on documents."""
-        query_to_embed = f"query: {query}"
-        query_embedding = self.embedding_model.encode(query_to_embed)
-        results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
-            n_results=k,
-            include=["metadatas", "documents", "distances"]
-        )
+        self._embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
+        self.collection_version = collection_version
+        self.query_embedding_cache = LRUCache(max_cached_queries)
+        self.results_cache = LRUCache(max_cached_queries)
+        self.keyword_index = keyword_index if keyword_index is not None else BM25Index.from_collection(chroma_collection)
+        self._search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="hybrid-search")
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        """The shared embedding model, taken from the model registry on first use."""
+        if self._embedding_model is None:
+            self._embedding_model = get_embedding_model()
+        return self._embedding_model
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing the embedding of a previously seen (normalized) query."""
+        key = normalize_text(query)
+        query_embedding = self.query_embedding_cache.get(key)
+        if query_embedding is None:
+            query_embedding = encode_texts(self.embedding_model, [query], prefix="query: ", cache=self.embedding_cache)[0]
+            self.query_embedding_cache.put(key, query_embedding)
+        return query_embedding
+
+    def similarity_search(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Perform similarity search on documents, restricted to chunks matching filters."""
+        where = filters_to_where(filters)
+        query_embedding = self.embed_query(query)
+        with pipeline_metrics.span("vector_query"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding.tolist()],
+                n_results=k,
+                where=where,
+                include=["metadatas", "documents", "distances"]
+            )
         return self._format_results(results)
     
-    def keyword_search(self, query: str, k: int = 10) -> List[Dict]:
-        all_docs = self.collection.get(include=["metadatas", "documents"])
+    def keyword_search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Rank documents matching filters by BM25 over the inverted index and fetch only the top k."""
+        filters_to_where(filters)  # validates the filter fields
+        with pipeline_metrics.span("keyword_search"):
+            hits = self.keyword_index.search(query, k=k, filters=filters)
+            if not hits:
+                return []
 
-        keywords = query.lower().split()
-        if not keywords:
-            return []
-        
-        matched_docs = []
-        if all_docs and all_docs.get('ids'):
-            for i, doc_content in enumerate(all_docs['documents']):
-                score = 0
-                content_lower = doc_content.lower()
-                # Simple scoring: count how many unique keywords appear in the document
-                for keyword in set(keywords):
-                    if re.search(r'\b' + re.escape(keyword) + r'\b', content_lower):
-                        score += 1
-                if score > 0:
-                    matched_docs.append({
-                        'id': all_docs['ids'][i],
-                        'content': doc_content,
-                        'score': score, # The score is the number of keyword hits
-                        'metadata': all_docs['metadatas'][i]
-                    })
+            retrieved_data = self.collection.get(ids=[doc_id for doc_id, _ in hits], include=["metadatas", "documents"])
+        docs_by_id = {retrieved_data['ids'][i]: i for i in range(len(retrieved_data['ids']))}
 
-        # Sort by score (higher is better) and return top k
-        matched_docs.sort(key=lambda x: x['score'], reverse=True)
-        return matched_docs[:k]
+        matched_docs = []
+        for doc_id, score in hits:
+            if doc_id in docs_by_id:
+                i = docs_by_id[doc_id]
+                matched_docs.append({
+                    'id': doc_id,
+                    'content': retrieved_data['documents'][i],
+                    'score': score, # BM25 score
+                    'metadata': retrieved_data['metadatas'][i]
+                })
+        return matched_docs
 
     
-    def hybrid_search(self, query: str, k: int = 5) -> List[Dict]:
+    def hybrid_search(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """
         Performs a robust hybrid search using Reciprocal Rank Fusion (RRF)
         to combine semantic and keyword search results.
         """
-        # 1. Fetch results from both search methods
-        semantic_results = self.similarity_search(query, k=20)
-        keyword_results = self.keyword_search(query, k=20)
-
-        # 2. Fuse the results using RRF
-        fused_scores = self._reciprocal_rank_fusion([semantic_results, keyword_results])
-
-        if not fused_scores:
-            return []
+        filters_to_where(filters)  # validates the filter fields before anything is cached
+        if self.collection_version is None:
+            with pipeline_metrics.span("hybrid_search"):
+                return self._hybrid_search(query, k, filters)
+
+        # Read the version before searching: a write that lands mid-search bumps it,
+        # so the (possibly stale) result is filed under a key no later lookup uses
+        key = (normalize_text(query), k, _filters_key(filters), self.collection_version())
+        cached = self.results_cache.get(key)
+        if cached is not None:
+            return [dict(doc) for doc in cached]
+
+        with pipeline_metrics.span("hybrid_search"):
+            results = self._hybrid_search(query, k, filters)
+        self.results_cache.put(key, results)
+        return [dict(doc) for doc in results]
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit/miss counters of the query embedding and hybrid search result caches."""
+        return {
+            'query_embeddings': self.query_embedding_cache.stats(),
+            'search_results': self.results_cache.stats(),
+        }
+
+    def _hybrid_search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        # 1. Fetch results from both search methods concurrently: the semantic leg (model
+        # forward pass + vector query) runs on the pool while the keyword leg runs here.
+        semantic_future = self._search_executor.submit(self.similarity_search, query, 20, filters)
+        keyword_results = self.keyword_search(query, k=20, filters=filters)
+        semantic_results = semantic_future.result()
+
+        with pipeline_metrics.span("fusion"):
+            # 2. Fuse the results using RRF
+            fused_scores = self._reciprocal_rank_fusion([semantic_results, keyword_results])
+
+            if not fused_scores:
+                return []
         
-        # 3. Create a final sorted list of results based on the fused scores
-        all_retrieved_ids = list(fused_scores.keys())
-        retrieved_data = self.collection.get(ids=all_retrieved_ids, include=["documents", "metadatas"])
-
-        # Create a dictionary for quick lookup
-        docs_by_id = {retrieved_data['ids'][i]: {'content': retrieved_data['documents'][i], 'metadata': retrieved_data['metadatas'][i]} for i in range(len(retrieved_data['ids']))}
-        final_results = []
-        for doc_id, score in fused_scores.items():
-            if doc_id in docs_by_id:
-                final_results.append({
-                    'id': doc_id,
-                    'content': docs_by_id[doc_id]['content'],
-                    'metadata': docs_by_id[doc_id]['metadata'],
-                    'score': score # Use the raw RRF score for ranking
-                })
+            # 3. Create a final sorted list of results based on the fused scores,
+            # reusing the content and metadata both legs already returned
+            docs_by_id = {doc['id']: doc for doc in keyword_results + semantic_results}
+            final_results = []
+            for doc_id, score in fused_scores.items():
+                if doc_id in docs_by_id:
+                    final_results.append({
+                        'id': doc_id,
+                        'content': docs_by_id[doc_id]['content'],
+                        'metadata': docs_by_id[doc_id]['metadata'],
+                        'score': score # Use the raw RRF score for ranking
+                    })
 
-        # Sort the final list by the RRF score in descending order
-        final_results.sort(key=lambda x: x['score'], reverse=True)  
+            # Sort the final list by the RRF score in descending order
+            final_results.sort(key=lambda x: x['score'], reverse=True)  
 
-        # 4. Normalize the scores for the top k results
-        top_k_results = final_results[:k]
-        scores_for_norm = [doc['score'] for doc in top_k_results]   
+            # 4. Normalize the scores for the top k results
+            top_k_results = final_results[:k]
+            scores_for_norm = [doc['score'] for doc in top_k_results]   
 
-        if not scores_for_norm:
-            return []
+            if not scores_for_norm:
+                return []
 
-        min_score, max_score = min(scores_for_norm), max(scores_for_norm)
+            min_score, max_score = min(scores_for_norm), max(scores_for_norm)
 
-        for doc in top_k_results:
-            normalized_score = 0.0
-            if max_score > min_score:
-                normalized_score = (doc['score'] - min_score) / (max_score - min_score)
-            elif max_score > 0:
-                normalized_score = 1.0
-            doc['score'] = normalized_score # Replace raw RRF score with normalized score  
+            for doc in top_k_results:
+                normalized_score = 0.0
+                if max_score > min_score:
+                    normalized_score = (doc['score'] - min_score) / (max_score - min_score)
+                elif max_score > 0:
+                    normalized_score = 1.0
+                doc['score'] = normalized_score # Replace raw RRF score with normalized score  
 
         return top_k_results 
     
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set
+from .document_processor import DEFAULT_COLLECTION_NAME, KEYWORD_INDEX_FILE, DocumentProcessor, delete_collection_files
+from .retrieval_system import DocumentRetriever
+
+# Tenant whose collection is the original shared one, used when no tenant or session is given
+DEFAULT_TENANT = "default"
+# A tenant's collection is unloaded after this many seconds without use
+TENANT_IDLE_SECONDS = float(os.environ.get("TENANT_IDLE_SECONDS", "1800"))
+# Estimated memory all loaded tenant collections may take before the least recently used are unloaded.
+# Only memory that unloading frees is counted: with the default Chroma backend that is the keyword
+# index alone, as the Chroma client keeps each collection's HNSW index resident either way
+TENANT_MEMORY_BUDGET_MB = float(os.environ.get("TENANT_MEMORY_BUDGET_MB", "2048"))
+# A tenant's collection is deleted from disk after this many seconds without use (0 keeps them forever),
+# so the collections of abandoned sessions do not pile up
+TENANT_RETENTION_SECONDS = float(os.environ.get("TENANT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Abandoned collections are looked for at most this often
+CLEANUP_INTERVAL_SECONDS = 3600
+TENANT_COLLECTION_PREFIX = "tenant_"
+# Rough in-memory cost of one keyword index posting (dict entries for term -> doc ID -> count)
+BYTES_PER_POSTING = 100
+
+def tenant_collection_name(tenant_id: str) -> str:
+    """Collection name of a tenant; IDs are hashed, so any string is a valid tenant ID."""
+    if tenant_id == DEFAULT_TENANT:
+        return DEFAULT_COLLECTION_NAME
+    return f"{TENANT_COLLECTION_PREFIX}{hashlib.sha256(tenant_id.encode('utf-8')).hexdigest()[:16]}"
+
+def estimate_memory_bytes(doc_processor: DocumentProcessor) -> int:
+    """
+    Approximate memory that unloading a collection frees: the keyword index postings, plus the
+    searched vectors of stores that release them (the NumPy stores; Chroma keeps its own).
+    """
+    collection = doc_processor.collection
+    vector_bytes = collection.memory_bytes() if hasattr(collection, 'memory_bytes') else 0
+    return vector_bytes + doc_processor.keyword_index.total_postings * BYTES_PER_POSTING
+
+class TenantSession:
+    def __init__(self, tenant_id: str, doc_processor: DocumentProcessor, retriever: DocumentRetriever):
+        self.tenant_id = tenant_id
+        self.doc_processor = doc_processor
+        self.retriever = retriever
+        self.last_used = time.time()
+        # Requests currently using the collection (see TenantCollections.lease); it is not unloaded meanwhile
+        self.leases = 0
+        # Estimated memory, measured at collection version measured_version (re-measured after writes)
+        self.memory_bytes = 0
+        self.measured_version: Optional[int] = None
+
+class TenantCollections:
+    """
+    One collection (vector store, keyword index and retriever) per tenant or session, so each
+    search only covers that tenant's documents. Collections are opened on first use and unloaded
+    again once idle for idle_seconds, or, least recently used first, while the estimated memory of
+    the loaded collections exceeds the budget. Every write is already persisted, so an unloaded
+    collection is simply reopened from disk on its next use; without a persist_directory the
+    collections are kept in a temporary directory for that purpose. Collections of tenants that
+    have not been used for retention_seconds are deleted from disk (see remove_abandoned); the
+    shared default collection is always kept. They are looked for on a background thread, so
+    requests only ever wait for the deletion of a collection they are about to open.
+
+    processor_factory(persist_directory, collection_name) builds a DocumentProcessor; pass one that
+    reuses the shared embedding model and cache (see chat_pipeline.create_document_processor).
+    is_busy(doc_processor) may report pending writes (e.g. IngestionQueue.has_pending); such
+    collections are never unloaded, and neither are those leased for a request (see lease()).
+    A collection unloaded while something still holds its DocumentProcessor is handed out again
+    rather than opened a second time, so two processors never write to the same files.
+
+    Unloading only drops this object's references. The NumPy stores then release their arrays;
+    with the default Chroma backend the client keeps the collection's HNSW index in memory
+    unless Chroma's own segment cache is limited (CHROMA_SEGMENT_CACHE_POLICY=LRU with
+    CHROMA_MEMORY_LIMIT_BYTES).
+    """
+
+    def __init__(self, processor_factory: Callable[[str, str], DocumentProcessor],
+                 persist_directory: Optional[str] = None, idle_seconds: float = TENANT_IDLE_SECONDS,
+                 memory_budget_mb: float = TENANT_MEMORY_BUDGET_MB,
+                 is_busy: Optional[Callable[[DocumentProcessor], bool]] = None,
+                 retention_seconds: float = TENANT_RETENTION_SECONDS):
+        self.processor_factory = processor_factory
+        self.persist_directory = persist_directory or tempfile.mkdtemp(prefix="tenant_collections_")
+        self.idle_seconds = idle_seconds
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.is_busy = is_busy
+        self.retention_seconds = retention_seconds
+        self.evictions = 0
+        self.removed = 0
+        self._last_cleanup = 0.0
+        self._sessions: "OrderedDict[str, TenantSession]" = OrderedDict()
+        # Processors of unloaded collections, for as long as something else still references them
+        self._unloaded: "weakref.WeakValueDictionary[str, DocumentProcessor]" = weakref.WeakValueDictionary()
+        # Collections being deleted by remove_abandoned; opening one waits until it is gone
+        self._removing: Set[str] = set()
+        self._lock = threading.RLock()
+        self._removal_done = threading.Condition(self._lock)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, tenant_id: str = DEFAULT_TENANT) -> TenantSession:
+        """The tenant's loaded collection, opening (or reopening) it if needed."""
+        with self._lock:
+            session = self._sessions.get(tenant_id)
+            if session is None:
+                collection_name = tenant_collection_name(tenant_id)
+                while collection_name in self._removing:
+                    self._removal_done.wait()
+                doc_processor = self._unloaded.pop(tenant_id, None) or \
+                    self.processor_factory(self.persist_directory, collection_name)
+                retriever = DocumentRetriever(
+                    doc_processor.collection, embedding_model=doc_processor.embedding_model,
+                    keyword_index=doc_processor.keyword_index, embedding_cache=doc_processor.embedding_cache,
+                    collection_version=lambda: doc_processor.collection_version
+                )
+                session = TenantSession(tenant_id, doc_processor, retriever)
+                self._sessions[tenant_id] = session
+            session.last_used = time.time()
+            self._sessions.move_to_end(tenant_id)
+            self._touch(session)
+            self._evict(keep=tenant_id)
+            if session.last_used - self._last_cleanup > CLEANUP_INTERVAL_SECONDS:
+                self._last_cleanup = session.last_used
+                threading.Thread(target=self.remove_abandoned, name="tenant-cleanup", daemon=True).start()
+            return session
+
+    @contextmanager
+    def lease(self, tenant_id: str = DEFAULT_TENANT) -> Iterator[TenantSession]:
+        """
+        The tenant's collection (see get), kept loaded until the block ends. Hold it for a whole
+        request, so the collection cannot be unloaded between e.g. looking it up and queueing an upload.
+        """
+        with self._lock:
+            session = self.get(tenant_id)
+            session.leases += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.leases -= 1
+                session.last_used = time.time()
+
+    def loaded_tenants(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions)
+
+    def unload(self, tenant_id: str) -> bool:
+        """Drop a tenant's collection from memory; its data stays on disk. Returns False if it was not loaded."""
+        with self._lock:
+            session = self._sessions.pop(tenant_id, None)
+            if session is None:
+                return False
+            self._unloaded[tenant_id] = session.doc_processor
+            return True
+
+    def drop(self, tenant_id: str):
+        """Delete a tenant's documents, on disk as well as in memory."""
+        with self._lock:
+            session = self._sessions.pop(tenant_id, None)
+            doc_processor = session.doc_processor if session else self._unloaded.pop(tenant_id, None)
+            if doc_processor is None:
+                doc_processor = self.processor_factory(self.persist_directory, tenant_collection_name(tenant_id))
+            doc_processor.drop()
+
+    @staticmethod
+    def _touch(session: TenantSession):
+        """Record the use on disk: the keyword index file's modification time is the collection's last use."""
+        path = session.doc_processor.keyword_index_path
+        if path and os.path.exists(path):
+            os.utime(path)
+
+    def remove_abandoned(self) -> List[str]:
+        """
+        Delete the collections of tenants (other than the default one) that are not loaded and
+        have not been used for retention_seconds, straight from disk without opening them.
+        The lock is only held to claim each collection. Returns the names of the deleted collections.
+        """
+        if not self.retention_seconds:
+            return []
+        suffix = f"_{KEYWORD_INDEX_FILE}"
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            file_name[:-len(suffix)] for file_name in os.listdir(self.persist_directory)
+            if file_name.startswith(TENANT_COLLECTION_PREFIX) and file_name.endswith(suffix)
+            and os.path.getmtime(os.path.join(self.persist_directory, file_name)) < cutoff
+        ]
+        removed = []
+        for collection_name in expired:
+            path = os.path.join(self.persist_directory, f"{collection_name}{suffix}")
+            with self._lock:
+                in_use = list(self._sessions) + list(self._unloaded.keys())
+                # Checked again under the lock: the tenant may have come back since the listing
+                if collection_name in {tenant_collection_name(tenant_id) for tenant_id in in_use} or \
+                        not os.path.exists(path) or os.path.getmtime(path) >= cutoff:
+                    continue
+                self._removing.add(collection_name)
+            try:
+                print(f"Deleting collection '{collection_name}', unused for over {self.retention_seconds:.0f}s")
+                delete_collection_files(self.persist_directory, collection_name)
+                removed.append(collection_name)
+            finally:
+                with self._lock:
+                    self._removing.discard(collection_name)
+                    self._removal_done.notify_all()
+        with self._lock:
+            self.removed += len(removed)
+        return removed
+
+    @staticmethod
+    def _memory_bytes(session: TenantSession) -> int:
+        version = session.doc_processor.collection_version
+        if session.measured_version != version:
+            session.memory_bytes = estimate_memory_bytes(session.doc_processor)
+            session.measured_version = version
+        return session.memory_bytes
+
+    def _busy(self, session: TenantSession) -> bool:
+        return session.leases > 0 or (self.is_busy is not None and self.is_busy(session.doc_processor))
+
+    def _evict(self, keep: str):
+        """Unload idle collections, then the least recently used ones until the memory budget is met."""
+        now = time.time()
+        for tenant_id, session in list(self._sessions.items()):
+            if tenant_id != keep and now - session.last_used > self.idle_seconds and not self._busy(session):
+                print(f"Unloading collection of tenant '{tenant_id}' after {now - session.last_used:.0f}s idle")
+                self.unload(tenant_id)
+                self.evictions += 1
+
+        sizes = {tenant_id: self._memory_bytes(session) for tenant_id, session in self._sessions.items()}
+        total = sum(sizes.values())
+        # Oldest first (the OrderedDict is in least recently used order)
+        for tenant_id, session in list(self._sessions.items()):
+            if total <= self.memory_budget_bytes:
+                break
+            if tenant_id == keep or self._busy(session):
+                continue
+            print(f"Unloading collection of tenant '{tenant_id}' to stay within the memory budget")
+            self.unload(tenant_id)
+            total -= sizes[tenant_id]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'loaded_tenants': len(self._sessions),
+                'memory_bytes': sum(self._memory_bytes(session) for session in self._sessions.values()),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'evictions': self.evictions,
+                'removed_collections': self.removed,
+            }
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_TRANSLATION_CACHE_PATH = os.environ.get("TRANSLATION_CACHE_PATH", os.path.join(".cache", "translations.sqlite3"))
+# Expired and over-limit entries are purged every this many insertions
+EVICTION_INTERVAL = 100
+
+class TranslationCache:
+    """
+    Persistent translation cache keyed by (source language, target language, text).
+    Entries expire after ttl_seconds; beyond max_entries the least recently used are dropped.
+    Backed by SQLite, so several processes can share one cache file.
+    """
+
+    def __init__(self, path: str = DEFAULT_TRANSLATION_CACHE_PATH, ttl_seconds: float = 30 * 24 * 3600,
+                 max_entries: int = 50_000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+        self._connection.commit()
+
+    @staticmethod
+    def _key(text: str, source_lang: str, target_lang: str) -> str:
+        return hashlib.sha256(f"{source_lang}\0{target_lang}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: List[str], target_lang: str, source_lang: str) -> Dict[str, str]:
+        """Return a {text: translation} dict for the texts that have a live cache entry."""
+        keys = {self._key(text, source_lang, target_lang): text for text in set(texts)}
+        if not keys:
+            return {}
+
+        now = time.time()
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, translated_text FROM translations WHERE key IN ({placeholders}) AND created_at > ?",
+                    (*batch, now - self.ttl_seconds)
+                ).fetchall()
+                for key, translated_text in rows:
+                    found[keys[key]] = translated_text
+            if found:
+                self._connection.executemany(
+                    "UPDATE translations SET last_used = ? WHERE key = ?",
+                    [(now, self._key(text, source_lang, target_lang)) for text in found]
+                )
+                self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        return self.get_many([text], target_lang, source_lang).get(text)
+
+    def put(self, text: str, translated_text: str, target_lang: str, source_lang: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(text, source_lang, target_lang), source_lang, target_lang, translated_text, now, now)
+            )
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= EVICTION_INTERVAL:
+                self._evict(now)
+                self._puts_since_eviction = 0
+            self._connection.commit()
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM translations WHERE created_at <= ?", (now - self.ttl_seconds,))
+        self._connection.execute(
+            """DELETE FROM translations WHERE key IN (
+                SELECT key FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,)
+        )
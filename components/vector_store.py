@@ -0,0 +1,729 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+import numpy as np
+import chromadb
+from .keyword_index import FILTER_FIELDS
+
+# chroma: Chroma collection; numpy: exact search over NumPy arrays; ivf: NumPy arrays with an inverted-file index
+VECTOR_STORE_BACKENDS = ("chroma", "numpy", "ivf")
+# Storage precisions: float32 (4 bytes/dim), float16 (2 bytes/dim) or int8 (1 byte/dim + one scale per vector)
+VECTOR_DTYPES = ("float32", "float16", "int8")
+# IDs, texts and metadata of a NumPy store, one database row per stored vector
+RECORDS_DATABASE = "records.sqlite3"
+# Single JSON file used for the records by earlier versions; migrated into the database on open
+RECORDS_FILE = "records.json"
+# Rows converted to float32 at a time while scoring, which bounds the temporary memory of a query
+SCORE_BLOCK_ROWS = 8192
+MIN_CAPACITY = 1024
+# IVF: number of lists searched per query (higher = better recall, slower)
+DEFAULT_NPROBE = int(os.environ.get("VECTOR_STORE_NPROBE", "16"))
+# IVF: below this many vectors search stays exact; the lists are re-trained each time the store grows by this factor
+IVF_MIN_TRAIN_SIZE = 10_000
+IVF_RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 40
+
+def _matches(metadata: Optional[Dict], where: Optional[Dict]) -> bool:
+    """Evaluate the subset of Chroma's `where` syntax used in this project: equality, comparison
+    operators, $in / $nin, and nested $and / $or."""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and not value == operand:
+                    return False
+                if operator == "$ne" and not value != operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if operator == "$gt" and not value > operand:
+                        return False
+                    if operator == "$gte" and not value >= operand:
+                        return False
+                    if operator == "$lt" and not value < operand:
+                        return False
+                    if operator == "$lte" and not value <= operand:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class ReadWriteLock:
+    """
+    Lets any number of readers in at once, or a single writer. Waiting writers go first,
+    so a steady stream of queries cannot hold off an ingest indefinitely.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class VectorStore(ABC):
+    """
+    Interface of the stores behind DocumentProcessor.collection and DocumentRetriever.collection,
+    modelled on the Chroma collection API. Embeddings may be passed as (n, dim) arrays or lists;
+    get() and query() return Chroma-shaped dictionaries.
+    """
+
+    @abstractmethod
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        ...
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def drop(self):
+        """Delete everything this store holds, including its files."""
+        ...
+
+# Database file a persistent Chroma client keeps in its directory
+CHROMA_DATABASE_FILE = "chroma.sqlite3"
+
+_chroma_clients: Dict[Optional[str], object] = {}
+_chroma_clients_lock = threading.Lock()
+
+def get_chroma_client(path: Optional[str] = None):
+    """Process-wide Chroma client for a path (None for in-memory), shared by every collection opened on it."""
+    with _chroma_clients_lock:
+        client = _chroma_clients.get(path)
+        if client is None:
+            if path:
+                os.makedirs(path, exist_ok=True)
+                client = chromadb.PersistentClient(path=path)
+            else:
+                client = chromadb.Client()
+            _chroma_clients[path] = client
+        return client
+
+def _as_lists(embeddings) -> List[List[float]]:
+    return [np.asarray(embedding, dtype=np.float32).tolist() for embedding in embeddings]
+
+class ChromaVectorStore(VectorStore):
+    """A Chroma collection, in memory or persisted under path."""
+
+    def __init__(self, name: str = "default", path: Optional[str] = None):
+        self.name = name
+        # On-disk store: reopening the same path picks up the existing collection
+        self.client = get_chroma_client(path)
+        self.collection = self.client.get_or_create_collection(name)
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        self.collection.add(ids=ids, embeddings=_as_lists(embeddings), documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        # Chroma validates embeddings as Python lists
+        self.collection.upsert(ids=ids, embeddings=_as_lists(embeddings), documents=documents, metadatas=metadatas)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents")) -> Dict:
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=list(include))
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("metadatas", "documents", "distances")) -> Dict:
+        return self.collection.query(query_embeddings=_as_lists(query_embeddings), n_results=n_results,
+                                     where=where, include=list(include))
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def drop(self):
+        self.client.delete_collection(self.name)
+
+class NumpyVectorStore(VectorStore):
+    """
+    Vector store keeping embeddings in contiguous NumPy arrays.
+
+    Vectors are L2-normalized and stored as float32, float16 or scalar-quantized int8 (one
+    float32 scale per vector); distances are cosine distances. With rescore, a float32 copy is
+    also kept and the top n_results * rescore_candidates compact matches are re-ranked at full
+    precision. With a path, the arrays live in memory-mapped .npy files under it, so opening a
+    store reads no vectors up front, the float32 copy is only paged in for the rows being
+    re-scored, and processes opening the same store share the pages through the OS page cache
+    (only one process should write to a store). IDs and metadata are kept in memory; chunk texts
+    stay in a SQLite database next to the arrays and are read only for the rows returned, and
+    each write only touches the rows it changes. Within a process, get() and query() run
+    concurrently; writes wait for them and hold off new ones.
+
+    index='flat' scores every vector with one matrix product and picks the top k with
+    argpartition. index='ivf' partitions the vectors with k-means (about sqrt(n) lists, trained
+    once IVF_MIN_TRAIN_SIZE vectors are stored) and only scores the nprobe lists closest to the
+    query; filtered queries always search the matching rows exactly. Equality and $in conditions
+    on the FILTER_FIELDS are answered from an in-memory index instead of scanning every record.
+    """
+
+    def __init__(self, name: str = "default", path: Optional[str] = None, dtype: str = "float32",
+                 rescore: bool = True, rescore_candidates: int = 4, index: str = "flat",
+                 nprobe: int = DEFAULT_NPROBE, n_lists: Optional[int] = None):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}'. Available: {', '.join(VECTOR_DTYPES)}")
+        if index not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported index type '{index}'. Available: flat, ivf")
+        self.name = name
+        self.dtype = dtype
+        self.index = index
+        self.nprobe = nprobe
+        self.n_lists = n_lists
+        # float32 storage is already full precision
+        self.rescore = rescore and dtype != "float32"
+        self.rescore_candidates = rescore_candidates
+        self.directory = os.path.join(path, f"{name}.npstore") if path else None
+
+        self.ids: List[str] = []
+        self.metadatas: List[Optional[Dict]] = []
+        self._rows: Dict[str, int] = {}
+        self._field_ids: Dict[str, Dict[Any, Set[str]]] = {}
+        self._dim = 0
+        self._capacity = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._full: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._lock = ReadWriteLock()
+        # Readers share the lock above, so calls on the database connection are serialized separately
+        self._database_lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self._open_database()
+        if self.directory:
+            self._load()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def memory_bytes(self) -> int:
+        """Bytes taken by the vectors searched on every query (the compact array and int8 scales)."""
+        size = len(self.ids)
+        total = size * self._dim * np.dtype(self.dtype).itemsize
+        if self._scales is not None:
+            total += size * 4
+        return total
+
+    # --- storage ---
+
+    def _path(self, array_name: str) -> str:
+        return os.path.join(self.directory, f"{array_name}.npy")
+
+    def _allocate(self, array_name: str, shape, dtype) -> np.ndarray:
+        if not self.directory:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(self._path(f"{array_name}.tmp"), mode='w+', dtype=dtype, shape=shape)
+
+    def _ensure_capacity(self, dim: int, needed: int):
+        if self._vectors is not None and dim != self._dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the store's dimension {self._dim}")
+        if needed <= self._capacity:
+            return
+
+        capacity = max(needed, self._capacity * 2, MIN_CAPACITY)
+        arrays = {'vectors': ((capacity, dim), self.dtype)}
+        if self.dtype == "int8":
+            arrays['scales'] = ((capacity,), np.float32)
+        if self.rescore:
+            arrays['full'] = ((capacity, dim), np.float32)
+        if self.index == "ivf":
+            arrays['assignments'] = ((capacity,), np.int32)
+
+        size = len(self.ids)
+        for array_name, (shape, dtype) in arrays.items():
+            grown = self._allocate(array_name, shape, dtype)
+            old = getattr(self, f"_{array_name}")
+            if old is not None and size:
+                grown[:size] = old[:size]
+            if self.directory:
+                grown.flush()
+                del grown
+                os.replace(self._path(f"{array_name}.tmp"), self._path(array_name))
+                grown = np.lib.format.open_memmap(self._path(array_name), mode='r+')
+            setattr(self, f"_{array_name}", grown)
+        self._dim = dim
+        self._capacity = capacity
+
+    def _open_database(self):
+        """Open the records database: a file in the store directory, or in memory without a path."""
+        database = os.path.join(self.directory, RECORDS_DATABASE) if self.directory else ":memory:"
+        self._database = sqlite3.connect(database, check_same_thread=False)
+        if self.directory:
+            self._database.execute("PRAGMA journal_mode=WAL")
+        self._database.execute(
+            """CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT
+            )"""
+        )
+        self._database.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._database.commit()
+
+    def _migrate_records_file(self, records_path: str):
+        """Move the records of a store written by an earlier version from records.json into the database."""
+        print(f"Migrating '{records_path}' into {RECORDS_DATABASE}...")
+        with open(records_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        with self._database:
+            self._database.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                [(row, doc_id, document, json.dumps(metadata, ensure_ascii=False))
+                 for row, (doc_id, document, metadata)
+                 in enumerate(zip(records['ids'], records['documents'], records['metadatas']))]
+            )
+            self._database.executemany(
+                "INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                [(key, json.dumps(records.get(key))) for key in ('dtype', 'rescore', 'index', 'trained_size', 'dim')]
+            )
+        os.remove(records_path)
+
+    def _load(self):
+        records_path = os.path.join(self.directory, RECORDS_FILE)
+        if os.path.exists(records_path):
+            self._migrate_records_file(records_path)
+        settings = {key: json.loads(value) for key, value in self._database.execute("SELECT key, value FROM settings")}
+        if not settings:
+            return
+        if settings['dtype'] != self.dtype:
+            raise ValueError(f"Vector store '{self.directory}' holds {settings['dtype']} vectors, not {self.dtype}")
+        if (settings.get('index') or 'flat') != self.index:
+            raise ValueError(f"Vector store '{self.directory}' uses a {settings.get('index') or 'flat'} index, not {self.index}")
+
+        for doc_id, metadata in self._database.execute("SELECT id, metadata FROM records ORDER BY row"):
+            self.ids.append(doc_id)
+            self.metadatas.append(json.loads(metadata) if metadata is not None else None)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        for doc_id, metadata in zip(self.ids, self.metadatas):
+            self._index_fields(doc_id, metadata)
+        self._dim = settings['dim']
+        if not self._dim:
+            return
+        self._vectors = np.lib.format.open_memmap(self._path('vectors'), mode='r+')
+        self._capacity = self._vectors.shape[0]
+        if self.dtype == "int8":
+            self._scales = np.lib.format.open_memmap(self._path('scales'), mode='r+')
+        if self.rescore:
+            if os.path.exists(self._path('full')) and settings.get('rescore'):
+                self._full = np.lib.format.open_memmap(self._path('full'), mode='r+')
+            else:
+                print(f"Vector store '{self.directory}' has no full-precision copy; re-scoring is disabled")
+                self.rescore = False
+        if self.index == "ivf":
+            self._assignments = np.lib.format.open_memmap(self._path('assignments'), mode='r+')
+            self._trained_size = settings.get('trained_size') or 0
+            if self._trained_size:
+                self._centroids = np.load(self._path('centroids'))
+
+    def _persist(self):
+        """Flush the arrays, then commit the pending record changes together with the store settings."""
+        for array in (self._vectors, self._scales, self._full):
+            if isinstance(array, np.memmap):
+                array.flush()
+        settings = {
+            'dtype': self.dtype,
+            'rescore': self.rescore,
+            'index': self.index,
+            'trained_size': self._trained_size,
+            'dim': self._dim,
+        }
+        with self._database_lock:
+            self._database.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                                       [(key, json.dumps(value)) for key, value in settings.items()])
+            self._database.commit()
+
+    def _documents(self, rows: Sequence[int]) -> List[Optional[str]]:
+        """Texts stored at the given rows, read from the records database."""
+        unique_rows = list({int(row) for row in rows})
+        found = {}
+        with self._database_lock:
+            for start in range(0, len(unique_rows), 500):
+                batch = unique_rows[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._database.execute(
+                    f"SELECT row, document FROM records WHERE row IN ({placeholders})", batch
+                ))
+        return [found.get(int(row)) for row in rows]
+
+    def _write_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        """Store normalized float32 vectors at the given row positions in the configured precision."""
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._vectors[rows] = vectors.astype(self.dtype)
+        if self.rescore:
+            self._full[rows] = vectors
+        if self._centroids is not None:
+            self._assignments[rows] = self._assign(vectors)
+
+    def _read_rows(self, rows: Sequence[int]) -> np.ndarray:
+        """Vectors at the given rows as float32, at full precision when available."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.rescore:
+            return np.asarray(self._full[rows])
+        vectors = self._vectors[rows].astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    # --- Chroma-compatible API ---
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        """Insert or overwrite records. embeddings may be an (n, dim) array; no per-float list conversion is needed."""
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        with self._lock.write():
+            new_ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._rows]
+            self._ensure_capacity(vectors.shape[1], len(self.ids) + len(new_ids))
+            for doc_id in new_ids:
+                self._rows[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.metadatas.append(None)
+
+            rows = np.array([self._rows[doc_id] for doc_id in ids], dtype=np.int64)
+            self._write_rows(rows, vectors)
+            for i, row in enumerate(rows):
+                if metadatas is not None:
+                    self._unindex_fields(ids[i], self.metadatas[row])
+                    self.metadatas[row] = metadatas[i]
+                    self._index_fields(ids[i], metadatas[i])
+            records = [(int(row), ids[i], json.dumps(self.metadatas[row], ensure_ascii=False)) for i, row in enumerate(rows)]
+            with self._database_lock:
+                if documents is not None:
+                    self._database.executemany(
+                        "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                        [(row, doc_id, documents[i], metadata) for i, (row, doc_id, metadata) in enumerate(records)]
+                    )
+                else:
+                    # Without documents, existing texts are kept
+                    self._database.executemany(
+                        """INSERT INTO records (row, id, metadata) VALUES (?, ?, ?)
+                           ON CONFLICT (row) DO UPDATE SET id = excluded.id, metadata = excluded.metadata""",
+                        records
+                    )
+            if self.index == "ivf" and len(self.ids) >= max(IVF_MIN_TRAIN_SIZE, self._trained_size * IVF_RETRAIN_GROWTH):
+                self._train_ivf()
+            self._persist()
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def _index_fields(self, doc_id: str, metadata: Optional[Dict]):
+        for field in FILTER_FIELDS:
+            if metadata and field in metadata:
+                self._field_ids.setdefault(field, {}).setdefault(metadata[field], set()).add(doc_id)
+
+    def _unindex_fields(self, doc_id: str, metadata: Optional[Dict]):
+        for field in FILTER_FIELDS:
+            if metadata and field in metadata:
+                matching = self._field_ids[field][metadata[field]]
+                matching.discard(doc_id)
+                if not matching:
+                    del self._field_ids[field][metadata[field]]
+
+    def _indexed_ids(self, where: Dict) -> Optional[Set[str]]:
+        """IDs matching `where` from the field index, or None when it uses operators or fields that are not indexed."""
+        matching: Optional[Set[str]] = None
+        for key, condition in where.items():
+            if key == "$and":
+                clause_ids = [self._indexed_ids(clause) for clause in condition]
+                if any(ids is None for ids in clause_ids):
+                    return None
+                key_ids = set.intersection(*clause_ids) if clause_ids else set(self._rows)
+            elif key not in FILTER_FIELDS:
+                return None
+            elif isinstance(condition, dict):
+                if len(condition) != 1 or not set(condition) <= {"$eq", "$in"}:
+                    return None
+                operand = next(iter(condition.values()))
+                values = operand if "$in" in condition else [operand]
+                key_ids = set().union(*(self._field_ids.get(key, {}).get(value, set()) for value in values))
+            else:
+                key_ids = set(self._field_ids.get(key, {}).get(condition, set()))
+            matching = key_ids if matching is None else matching & key_ids
+        return matching
+
+    def _select_rows(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> List[int]:
+        if ids is None and where:
+            indexed = self._indexed_ids(where)
+            if indexed is not None:
+                return sorted(self._rows[doc_id] for doc_id in indexed)
+        if ids is not None:
+            rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        else:
+            rows = range(len(self.ids))
+        if where:
+            rows = [row for row in rows if _matches(self.metadatas[row], where)]
+        return list(rows)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict:
+        with self._lock.read():
+            rows = self._select_rows(ids, where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            embeddings = None
+            if "embeddings" in include:
+                embeddings = self._read_rows(rows) if rows else np.empty((0, self._dim), dtype=np.float32)
+            return {
+                'ids': [self.ids[row] for row in rows],
+                'documents': self._documents(rows) if "documents" in include else None,
+                'metadatas': [self.metadatas[row] for row in rows] if "metadatas" in include else None,
+                'embeddings': embeddings,
+            }
+
+    # --- IVF ---
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Index of the closest centroid for each (normalized float32) vector."""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = vectors[start:start + SCORE_BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        return assignments
+
+    def _train_ivf(self):
+        """Spherical k-means on a sample of the stored vectors, then assign every vector to a list."""
+        count = len(self.ids)
+        n_lists = min(count, self.n_lists or max(1, int(np.sqrt(count))))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, size=min(count, n_lists * KMEANS_SAMPLE_PER_LIST), replace=False))
+        sample = self._read_rows(sample_rows)
+        print(f"Training IVF index with {n_lists} lists on {len(sample)} of {count} vectors...")
+
+        self._centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = self._assign(sample)
+            sums = np.zeros_like(self._centroids)
+            np.add.at(sums, assignments, sample)
+            non_empty = np.bincount(assignments, minlength=n_lists) > 0
+            norms = np.linalg.norm(sums[non_empty], axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            self._centroids[non_empty] = sums[non_empty] / np.where(norms == 0, 1.0, norms)
+
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            rows = np.arange(start, min(start + SCORE_BLOCK_ROWS, count))
+            self._assignments[rows] = self._assign(self._read_rows(rows))
+        self._trained_size = count
+        if self.directory:
+            np.save(self._path('centroids'), self._centroids)
+
+    def _probe_rows(self, query: np.ndarray) -> np.ndarray:
+        """Rows in the nprobe lists whose centroids are closest to the query."""
+        centroid_scores = self._centroids @ query
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        probed = np.zeros(len(centroid_scores), dtype=bool)
+        probed[probes] = True
+        return np.flatnonzero(probed[self._assignments[:len(self.ids)]])
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of the query to every stored vector (or to the given rows), from the compact array."""
+        count = len(self.ids) if rows is None else len(rows)
+        if self.dtype == "float32":
+            # No conversion needed: a single matrix-vector product
+            return (self._vectors[:count] if rows is None else self._vectors[rows]) @ query
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, count)
+            if rows is None:
+                block = self._vectors[start:end]
+                scales = self._scales[start:end] if self._scales is not None else None
+            else:
+                block = self._vectors[rows[start:end]]
+                scales = self._scales[rows[start:end]] if self._scales is not None else None
+            block_scores = block.astype(np.float32, copy=False) @ query
+            if scales is not None:
+                block_scores *= scales
+            scores[start:end] = block_scores
+        return scores
+
+    def _top_k(self, query: np.ndarray, n_results: int, rows: Optional[np.ndarray]) -> List[tuple]:
+        """(row, similarity) of the best matches, re-scored at full precision when enabled."""
+        if rows is None and self._centroids is not None:
+            rows = self._probe_rows(query)
+        scores = self._scores(query, rows)
+        candidates = n_results * self.rescore_candidates if self.rescore else n_results
+        candidates = min(candidates, len(scores))
+        if candidates == 0:
+            return []
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if self.rescore:
+            # Sorted rows read the memory-mapped float32 copy in file order
+            candidate_rows = np.sort(top if rows is None else rows[top])
+            exact = np.asarray(self._full[candidate_rows]) @ query
+            order = np.argsort(-exact)[:n_results]
+            return [(int(candidate_rows[i]), float(exact[i])) for i in order]
+        top = top[np.argsort(-scores[top])]
+        top_rows = top if rows is None else rows[top]
+        return [(int(row), float(score)) for row, score in zip(top_rows, scores[top])]
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(1, -1) if queries.ndim == 1 else queries
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        with self._lock.read():
+            if self._vectors is None:
+                return {key: [[] for _ in queries] for key in results}
+            rows = np.asarray(self._select_rows(where=where), dtype=np.int64) if where else None
+            for query in queries:
+                norm = np.linalg.norm(query)
+                matches = self._top_k(query / norm if norm else query, n_results, rows)
+                results['ids'].append([self.ids[row] for row, _ in matches])
+                if "documents" in include:
+                    results['documents'].append(self._documents([row for row, _ in matches]))
+                results['metadatas'].append([self.metadatas[row] for row, _ in matches])
+                results['distances'].append([1.0 - score for _, score in matches])
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                results[key] = None
+        return results
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """Remove records; the last row is moved into each freed slot so the arrays stay contiguous."""
+        with self._lock.write():
+            rows = self._select_rows(ids, where) if (ids is not None or where) else []
+            for row in sorted(set(rows), reverse=True):
+                last = len(self.ids) - 1
+                del self._rows[self.ids[row]]
+                self._unindex_fields(self.ids[row], self.metadatas[row])
+                with self._database_lock:
+                    self._database.execute("DELETE FROM records WHERE row = ?", (row,))
+                    if row != last:
+                        self._database.execute("UPDATE records SET row = ? WHERE row = ?", (row, last))
+                if row != last:
+                    moved_id = self.ids[last]
+                    self.ids[row] = moved_id
+                    self.metadatas[row] = self.metadatas[last]
+                    self._vectors[row] = self._vectors[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    if self._full is not None:
+                        self._full[row] = self._full[last]
+                    if self._assignments is not None:
+                        self._assignments[row] = self._assignments[last]
+                    self._rows[moved_id] = row
+                self.ids.pop()
+                self.metadatas.pop()
+            if rows:
+                self._persist()
+
+    def drop(self):
+        with self._lock.write():
+            self.ids, self.metadatas, self._rows, self._field_ids = [], [], {}, {}
+            self._vectors = self._scales = self._full = self._assignments = self._centroids = None
+            self._dim = self._capacity = self._trained_size = 0
+            with self._database_lock:
+                self._database.close()
+                if self.directory:
+                    shutil.rmtree(self.directory, ignore_errors=True)
+                else:
+                    # An in-memory store stays usable, empty
+                    self._open_database()
+
+def delete_vector_store(name: str, path: str):
+    """
+    Delete a persisted store without opening it: the NumPy store directory of that name and,
+    if path holds a Chroma database, the Chroma collection.
+    """
+    shutil.rmtree(os.path.join(path, f"{name}.npstore"), ignore_errors=True)
+    if os.path.exists(os.path.join(path, CHROMA_DATABASE_FILE)):
+        try:
+            get_chroma_client(path).delete_collection(name)
+        except Exception as e:
+            # Chroma's error for a missing collection differs between versions
+            print(f"Chroma collection '{name}' not deleted: {e}")
+
+def create_vector_store(backend: str = "chroma", name: str = "default", path: Optional[str] = None,
+                        dtype: str = "float32", rescore: bool = True) -> VectorStore:
+    """Open (or create) the named store of the given backend, persisted under path when one is given."""
+    if backend == "chroma":
+        if dtype != "float32":
+            raise ValueError("The chroma backend stores float32 vectors only; use the numpy or ivf backend for compact storage")
+        return ChromaVectorStore(name, path)
+    if backend in ("numpy", "ivf"):
+        return NumpyVectorStore(name, path, dtype=dtype, rescore=rescore, index="ivf" if backend == "ivf" else "flat")
+    raise ValueError(f"Unknown vector store backend '{backend}'. Available: {', '.join(VECTOR_STORE_BACKENDS)}")
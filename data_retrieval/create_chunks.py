@@ -1,6 +1,7 @@
 import os
 import json
 from components.document_processor import DocumentProcessor
+from components.model_registry import get_embedding_cache
 
 # Directory containing your multilingual documents
 DOCS_DIR = "evaluation_docs/" 
@@ -18,7 +19,8 @@ def process_all_documents():
     # Create the output directory if it doesn't exist
     os.makedirs(os.path.dirname(CHUNKS_OUTPUT_FILE), exist_ok=True)
 
-    doc_processor = DocumentProcessor()
+    # Cached embeddings make re-running over an unchanged corpus skip the model entirely
+    doc_processor = DocumentProcessor(embedding_cache=get_embedding_cache())
     all_chunks = []
     
     # List all supported files in the directory
@@ -1,5 +1,10 @@
 import os
 import json
+import argparse
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import chromadb
@@ -7,56 +12,91 @@ import chromadb
 # Import the components from your project
 from components.retrieval_system import DocumentRetriever
 from components.nlp_processor import NLPProcessor
+from components.translation_cache import TranslationCache
 from components.document_processor import DocumentProcessor # Import the DocumentProcessor
+from components.model_registry import EMBEDDING_BACKEND, get_embedding_model, get_embedding_cache
+from components.embedding_backends import EMBEDDING_BACKENDS, check_parity
+from components.vector_store import VECTOR_DTYPES
 
 EVALUATION_DATASET_FILE = "data/evaluation_dataset.json" 
 # Directory containing the documents used to create the dataset
 DOCS_DIR = "evaluation_docs/"
 # The number of top results to retrieve for each query
 K_VALUES = [1, 3, 5, 10] 
+# Number of chunks and questions compared against the fp32 model by --parity
+PARITY_SAMPLE_SIZE = 256
+# The evaluation index is persisted here (one store per embedding backend) and only
+# re-embedded for documents that changed since the last run
+EVALUATION_STORE_DIR = os.path.join(".cache", "evaluation_store")
+# Queries searched concurrently
+EVALUATION_WORKERS = 8
 
 class RetrievalEvaluator:
-    def __init__(self, dataset_path, docs_path):
+    def __init__(self, dataset_path, docs_path, backend=EMBEDDING_BACKEND, workers=EVALUATION_WORKERS, rebuild=False,
+                 storage="chroma", rescore=True, index="flat"):
         """
-        Initializes the evaluator and builds a dedicated, in-memory vector database
-        for the evaluation run.
+        Initializes the evaluator and opens the dedicated, persisted vector database for the
+        evaluation documents, embedded with the given embedding backend. Documents unchanged
+        since the last run are not re-embedded; rebuild discards the stored index first.
+        storage is 'chroma' or a NumpyVectorStore precision (float32, float16, int8); index='ivf'
+        uses the NumPy store's IVF index (at float32 unless another precision is given).
         """
-        print("Initializing self-contained evaluation environment...")
+        if index == "ivf" and storage == "chroma":
+            storage = "float32"
+        print(f"Initializing self-contained evaluation environment ({backend} embedding backend, {storage} {index} storage)...")
+        self.backend = backend
+        self.workers = workers
+        self.run_name = backend if storage == "chroma" else f"{backend}-{storage}{'' if rescore else '-norescore'}{'-ivf' if index == 'ivf' else ''}"
+        store_path = os.path.join(EVALUATION_STORE_DIR, self.run_name)
+        if rebuild and os.path.exists(store_path):
+            shutil.rmtree(store_path)
         
-        # 1. Initialize the document processor
-        self.doc_processor = DocumentProcessor()
+        # 1. Initialize the document processor with the shared embedding model
+        self.embedding_model = get_embedding_model(backend=backend)
+        self.embedding_cache = get_embedding_cache(backend=backend)
+        self.doc_processor = DocumentProcessor(embedding_model=self.embedding_model, embedding_cache=self.embedding_cache,
+                                               persist_directory=store_path,
+                                               vector_store="ivf" if index == "ivf" else None,
+                                               vector_dtype=None if storage == "chroma" else storage, rescore=rescore)
         
         # 2. Process and store the evaluation documents
         print(f"Processing evaluation documents from: '{docs_path}'")
         self.setup_database(docs_path)
         
         # 3. Initialize the retriever with the newly created collection
-        self.retriever = DocumentRetriever(self.doc_processor.collection)
+        self.retriever = DocumentRetriever(self.doc_processor.collection, embedding_model=self.embedding_model,
+                                           keyword_index=self.doc_processor.keyword_index,
+                                           embedding_cache=self.embedding_cache, search_workers=workers,
+                                           collection_version=lambda: self.doc_processor.collection_version)
         
-        # 4. Initialize the NLP processor for query translation
-        self.nlp_processor = NLPProcessor()
+        # 4. Initialize the NLP processor for query translation; cached translations are reused across runs
+        self.nlp_processor = NLPProcessor(translation_cache=TranslationCache())
         
         # Load the evaluation dataset
         self.dataset = self.load_dataset(dataset_path)
         print(f"Loaded {len(self.dataset)} Q&A pairs for evaluation.")
 
     def setup_database(self, path):
-        """Finds all documents, processes them, and stores them in the in-memory DB."""
+        """Brings the persisted evaluation DB in line with the documents: new or changed files are
+        (re-)ingested, unchanged ones are skipped and files no longer present are removed."""
         supported_files = [f for f in os.listdir(path) if f.endswith(('.pdf', '.docx', '.txt'))]
         if not supported_files:
             print(f"FATAL: No documents found in evaluation directory '{path}'.")
             exit()
             
         print(f"Found {len(supported_files)} documents to process for evaluation.")
+        for filename in self.doc_processor.list_stored_files() - set(supported_files):
+            self.doc_processor.delete_file(filename)
+
+        unchanged = 0
         for filename in tqdm(supported_files, desc="Processing Docs"):
             file_path = os.path.join(path, filename)
             try:
-                documents = self.doc_processor.process_document(file_path)
-                if documents:
-                    self.doc_processor.store_documents(documents)
+                summary = self.doc_processor.ingest_document(file_path)
+                unchanged += summary['status'] == 'unchanged'
             except Exception as e:
                 print(f"  Error processing {filename}: {e}")
-        print("In-memory vector database is ready for evaluation.")
+        print(f"Evaluation vector database is ready ({unchanged} of {len(supported_files)} documents reused unchanged).")
 
     def load_dataset(self, path):
         """Loads the JSON evaluation dataset."""
@@ -68,61 +108,84 @@ class RetrievalEvaluator:
             print("Please ensure you have created the dataset.")
             exit()
 
+    def run_parity_check(self):
+        """Compare this backend's embeddings and encoding speed against the fp32 PyTorch model."""
+        documents = self.doc_processor.collection.get(limit=PARITY_SAMPLE_SIZE, include=["documents"])['documents']
+        questions = [item['question'] for item in self.dataset[:PARITY_SAMPLE_SIZE]]
+        reference = get_embedding_model(backend="torch")
+
+        print(f"\n--- Embedding Parity: {self.backend} vs torch (fp32) ---")
+        for label, texts in (("passages", [f"passage: {text}" for text in documents]),
+                             ("queries", [f"query: {text}" for text in questions])):
+            if not texts:
+                continue
+            parity = check_parity(reference, self.embedding_model, texts)
+            print(f"{label}: {parity['texts']} texts, mean cosine {parity['mean_cosine']:.4f}, "
+                  f"min cosine {parity['min_cosine']:.4f}, speedup {parity['speedup']:.2f}x")
+        # Single-query latency is what similarity_search pays per request
+        for model_label, model in (("torch", reference), (self.backend, self.embedding_model)):
+            start = time.perf_counter()
+            for question in questions[:32]:
+                model.encode([f"query: {question}"], convert_to_numpy=True)
+            per_query = (time.perf_counter() - start) / max(1, len(questions[:32]))
+            print(f"{model_label}: {per_query * 1000:.1f} ms per single query")
+        print("-" * 35)
+
     def run_evaluation(self):
         """
         Runs the full evaluation process across the dataset and prints the results.
+        Questions are translated up front in one cached batch, then searched concurrently.
         """
-        results = []
         max_k = max(K_VALUES)
+        print("\nTranslating questions (previously translated questions come from the cache)...")
+        english_queries = self.nlp_processor.translate_batch(
+            [item['question'] for item in self.dataset], target_lang='en-IN', source_lang='auto'
+        )
 
-        print(f"\nRunning evaluation for Top K = {max_k}...")
-        for item in tqdm(self.dataset, desc="Evaluating Queries"):
-            question = item['question']
-            ground_truth_id = item['chunk_id']
-            
-            # Initialize variables for this loop iteration to ensure they always exist
-            retrieved_ids = []
-            hit = False
-            rank = 0
+        print(f"Running evaluation for Top K = {max_k} with {self.workers} concurrent queries...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(tqdm(
+                executor.map(lambda pair: self.evaluate_query(pair[0], pair[1], max_k), zip(self.dataset, english_queries)),
+                total=len(self.dataset), desc="Evaluating Queries"
+            ))
+        wall_time = time.perf_counter() - start
 
-            try:
-                # 1. Translate the query to English
-                english_query = self.nlp_processor.translate_text(question, target_lang='en-IN', source_lang='auto')
-                
-                # If translation fails or returns an empty string, skip this item
-                if not english_query or not english_query.strip():
-                    print(f"\nWarning: Translation failed for question, skipping: '{question[:50]}...'")
-                    continue
-
-                # 2. Perform the hybrid search
-                retrieved_docs = self.retriever.hybrid_search(english_query, k=max_k)
-
-                # 3. Process the results if any documents were retrieved
-                if retrieved_docs:
-                    retrieved_ids = [doc['id'] for doc in retrieved_docs]
-                    if ground_truth_id in retrieved_ids:
-                        hit = True
-                        rank = retrieved_ids.index(ground_truth_id) + 1
-            
-            except Exception as e:
-                print(f"\nAn unexpected error occurred for question '{question[:50]}...': {e}")
-                # The variables will keep their default values (empty list, False, 0)
-                # and the loop will continue to the next item.
-
-            # 4. Append the results for this iteration
-            results.append({
-                'question': question,
-                'ground_truth_id': ground_truth_id,
-                'retrieved_ids': retrieved_ids,
-                'hit': hit,
-                'rank': rank
-            })
-            
         # Calculate and Display Metrics
-        self.calculate_and_print_metrics(results)
+        self.calculate_and_print_metrics([result for result in results if result is not None], wall_time)
 
-    def calculate_and_print_metrics(self, results):
-        """Calculates and prints key retrieval metrics."""
+    def evaluate_query(self, item, english_query, max_k):
+        """Search one translated question and record where its ground-truth chunk ranks, and how long it took."""
+        question = item['question']
+        ground_truth_id = item['chunk_id']
+        
+        # If translation failed or returned an empty string, skip this item
+        if not english_query or not english_query.strip():
+            print(f"\nWarning: Translation failed for question, skipping: '{question[:50]}...'")
+            return None
+
+        retrieved_ids = []
+        rank = 0
+        start = time.perf_counter()
+        try:
+            retrieved_docs = self.retriever.hybrid_search(english_query, k=max_k)
+            retrieved_ids = [doc['id'] for doc in retrieved_docs]
+            if ground_truth_id in retrieved_ids:
+                rank = retrieved_ids.index(ground_truth_id) + 1
+        except Exception as e:
+            print(f"\nAn unexpected error occurred for question '{question[:50]}...': {e}")
+
+        return {
+            'question': question,
+            'ground_truth_id': ground_truth_id,
+            'retrieved_ids': retrieved_ids,
+            'hit': rank > 0,
+            'rank': rank,
+            'latency_ms': (time.perf_counter() - start) * 1000,
+        }
+
+    def calculate_and_print_metrics(self, results, wall_time):
+        """Calculates and prints key retrieval metrics, search latency percentiles and throughput."""
         df = pd.DataFrame(results)
         total_queries = len(df)
         
@@ -139,12 +202,38 @@ class RetrievalEvaluator:
         print("-" * 35)
         
         print("Precision@k is equivalent to Hit Rate@k in this single-answer-per-question scenario.")
+        print("-" * 35)
+
+        p50, p95, p99 = np.percentile(df['latency_ms'], [50, 95, 99])
+        print(f"Search latency: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+        print(f"Throughput: {total_queries / wall_time:.1f} queries/s ({self.workers} concurrent)")
         print("------------------------------------\n")
 
-        df.to_csv("retrieval_evaluation_details.csv", index=False, encoding='utf-8-sig')
-        print("Detailed results saved to 'retrieval_evaluation_details.csv'")
+        # One results file per backend and storage, so recall can be compared between them
+        details_file = "retrieval_evaluation_details.csv" if self.run_name == "torch" else f"retrieval_evaluation_details_{self.run_name}.csv"
+        df.to_csv(details_file, index=False, encoding='utf-8-sig')
+        print(f"Detailed results saved to '{details_file}'")
 
 
 if __name__ == "__main__":
-    evaluator = RetrievalEvaluator(dataset_path=EVALUATION_DATASET_FILE, docs_path=DOCS_DIR)
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality on the evaluation dataset.")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=sorted(EMBEDDING_BACKENDS),
+                        help="Embedding backend to evaluate (run once per backend to compare recall).")
+    parser.add_argument("--parity", action="store_true",
+                        help="Also compare the backend's embeddings and speed against the fp32 torch model.")
+    parser.add_argument("--workers", type=int, default=EVALUATION_WORKERS, help="Queries searched concurrently.")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the persisted evaluation index and re-ingest everything.")
+    parser.add_argument("--storage", default="chroma", choices=["chroma", *VECTOR_DTYPES],
+                        help="Vector storage: Chroma, or the NumPy store at the given precision.")
+    parser.add_argument("--no-rescore", action="store_true",
+                        help="With float16/int8 storage, rank by the compact vectors only (no full-precision re-scoring).")
+    parser.add_argument("--index", default="flat", choices=["flat", "ivf"],
+                        help="NumPy store index: exact (flat) or IVF; IVF search only kicks in for large corpora.")
+    args = parser.parse_args()
+
+    evaluator = RetrievalEvaluator(dataset_path=EVALUATION_DATASET_FILE, docs_path=DOCS_DIR, backend=args.backend,
+                                   workers=args.workers, rebuild=args.rebuild, storage=args.storage,
+                                   rescore=not args.no_rescore, index=args.index)
+    if args.parity:
+        evaluator.run_parity_check()
     evaluator.run_evaluation()
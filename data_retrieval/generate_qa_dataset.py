@@ -1,6 +1,10 @@
 import os
 import json
 import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from groq import Groq
 from tqdm import tqdm
 import re
@@ -8,9 +12,15 @@ import toml
 
 CHUNKS_INPUT_FILE = "data/document_chunks.json"
 QA_OUTPUT_FILE = "data/evaluation_dataset_groq.json"
+# Every generated pair is appended here as soon as it is ready; a rerun skips the chunk_ids it already holds
+QA_CHECKPOINT_FILE = "data/evaluation_dataset_groq.jsonl"
 SECRETS_FILE_PATH = ".streamlit/secrets.toml"
 
 MODEL_ID = "llama-3.1-8b-instant"
+# Point at any OpenAI-style chat-completions server (e.g. a local fake for testing)
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL")
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 30
 
 def load_api_key(secret_key: str):
     try:
@@ -24,16 +34,6 @@ def load_api_key(secret_key: str):
         print(f"Error loading secrets file: {e}")
         return None
 
-# Load API Key and Initialize Client
-GROQ_API_KEY = load_api_key("GROQ_API_KEY")
-
-if not GROQ_API_KEY:
-    print("Groq API key not found in .streamlit/secrets.toml.")
-    print("Please add 'GROQ_API_KEY = \"gsk_YourKeyHere\"' to the file.")
-    exit()
-
-client = Groq(api_key=GROQ_API_KEY)
-
 SYSTEM_PROMPT_TEMPLATE = """
 You are an expert data generator for evaluating a question-answering system.
 Your task is to generate one high-quality, relevant question and a concise answer based *only* on the provided text chunk.
@@ -63,9 +63,51 @@ def robust_json_parser(text: str):
                 return None
     return None
 
-def generate_qna_for_chunk(chunk_content: str, retries=3, delay=5):
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second on average, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def create_client(base_url=GROQ_BASE_URL):
+    api_key = load_api_key("GROQ_API_KEY") or os.environ.get("GROQ_API_KEY")
+    if not api_key and not base_url:
+        print("Groq API key not found in .streamlit/secrets.toml.")
+        print("Please add 'GROQ_API_KEY = \"gsk_YourKeyHere\"' to the file.")
+        exit()
+    # A local fake server does not check the key
+    # Retries are handled by generate_qna_for_chunk, which also respects the rate limiter
+    return Groq(api_key=api_key or "local", base_url=base_url, max_retries=0)
+
+def _retry_after_seconds(error):
+    """Seconds requested by a 429 response's Retry-After header, if any."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def generate_qna_for_chunk(client, chunk_content: str, rate_limiter: TokenBucket, retries=5,
+                           backoff_base=1.0, backoff_max=60.0):
     prompt_content = SYSTEM_PROMPT_TEMPLATE.format(chunk_content=chunk_content)
     for attempt in range(retries):
+        rate_limiter.acquire()
         try:
             response = client.chat.completions.create(
                 model=MODEL_ID,
@@ -79,11 +121,36 @@ def generate_qna_for_chunk(chunk_content: str, retries=3, delay=5):
             if qna_json:
                 return qna_json
         except Exception as e:
-            print(f"  - Groq API Error on attempt {attempt + 1}: {e}. Retrying...")
+            if attempt == retries - 1:
+                print(f"  - Groq API Error on attempt {attempt + 1}: {e}. Giving up.")
+                break
+            # Exponential backoff with full jitter, unless the server says how long to wait
+            delay = _retry_after_seconds(e) or random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+            print(f"  - Groq API Error on attempt {attempt + 1}: {e}. Retrying in {delay:.1f}s...")
             time.sleep(delay)
     return None
 
-def create_evaluation_dataset():
+def load_checkpoint(path: str):
+    """Q&A records already generated by earlier runs, by chunk_id; a truncated last line is ignored."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    for line in content.splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        records[record['chunk_id']] = record
+    if content and not content.endswith("\n"):
+        # Terminate a line cut short by a crash so the next append starts on a fresh line
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("\n")
+    return records
+
+def create_evaluation_dataset(max_workers=MAX_CONCURRENT_REQUESTS, requests_per_minute=REQUESTS_PER_MINUTE,
+                              base_url=GROQ_BASE_URL, checkpoint_path=QA_CHECKPOINT_FILE, output_path=QA_OUTPUT_FILE):
     try:
         with open(CHUNKS_INPUT_FILE, 'r', encoding='utf-8') as f:
             chunks = json.load(f)
@@ -92,26 +159,49 @@ def create_evaluation_dataset():
         print("Please run `create_chunks.py` first to generate it.")
         return
 
-    evaluation_dataset = []
-    print(f"Starting Q&A generation for {len(chunks)} chunks using model: {MODEL_ID} on Groq")
-    for chunk in tqdm(chunks, desc="Generating Q&A"):
-        qna_pair = generate_qna_for_chunk(chunk['chunk_content'])
-        if qna_pair and 'question' in qna_pair and 'answer' in qna_pair:
-            evaluation_dataset.append({
+    client = create_client(base_url)
+    completed = load_checkpoint(checkpoint_path)
+    pending = [chunk for chunk in chunks if chunk['chunk_id'] not in completed]
+    rate_limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max_workers)
+    write_lock = threading.Lock()
+
+    print(f"Starting Q&A generation for {len(pending)} chunks ({len(completed)} already done) using model: {MODEL_ID} on Groq")
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(generate_qna_for_chunk, client, chunk['chunk_content'], rate_limiter): chunk
+            for chunk in pending
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating Q&A"):
+            chunk = futures[future]
+            qna_pair = future.result()
+            if not (qna_pair and 'question' in qna_pair and 'answer' in qna_pair):
+                print(f"  - Failed to generate valid Q&A for chunk_id: {chunk['chunk_id']}")
+                continue
+            record = {
                 "chunk_id": chunk['chunk_id'],
                 "source_document": chunk['source_document'],
                 "question": qna_pair['question'],
                 "ground_truth_answer": qna_pair['answer'],
                 "context": chunk['chunk_content']
-            })
-        else:
-            print(f"  - Failed to generate valid Q&A for chunk_id: {chunk['chunk_id']}")
-
-    with open(QA_OUTPUT_FILE, 'w', encoding='utf-8') as f:
+            }
+            completed[chunk['chunk_id']] = record
+            with write_lock:
+                checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+
+    # The final dataset follows the order of the chunks file
+    evaluation_dataset = [completed[chunk['chunk_id']] for chunk in chunks if chunk['chunk_id'] in completed]
+    with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(evaluation_dataset, f, ensure_ascii=False, indent=4)
 
-    print(f"\nDataset generation complete! Saved to: {QA_OUTPUT_FILE}")
+    print(f"\nDataset generation complete! Saved to: {output_path}")
     print(f"Total Q&A pairs created: {len(evaluation_dataset)}")
 
 if __name__ == "__main__":
-    create_evaluation_dataset()
+    parser = argparse.ArgumentParser(description="Generate a Q&A evaluation dataset from document chunks.")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_REQUESTS, help="Concurrent requests.")
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Request rate limit per minute.")
+    parser.add_argument("--base-url", default=GROQ_BASE_URL,
+                        help="Chat-completions server to use instead of Groq (e.g. a local fake server).")
+    args = parser.parse_args()
+    create_evaluation_dataset(max_workers=args.workers, requests_per_minute=args.rpm, base_url=args.base_url)
@@ -0,0 +1,168 @@
+__import__('pysqlite3')
+import sys
+sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+# Headless HTTP API for the RAG pipeline.
+#
+# Run with:  uvicorn service:app --host 0.0.0.0 --port 8000
+# Scale out by running several instances behind a load balancer; within one instance the
+# components are shared singletons and requests are served concurrently. API keys are read
+# from the SARVAM_API_KEY and HF_TOKEN environment variables (falling back to Streamlit secrets).
+# Requests carrying an X-Tenant-ID header only see that tenant's documents; without one they use
+# the default shared collection.
+
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, File, Header, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from components.chat_pipeline import LANGUAGE_OPTIONS, create_tenant_components, generate_chatbot_response
+from components.ingestion_worker import IngestionQueue
+from components.metrics import pipeline_metrics
+from components.retrieval_system import filters_to_where
+from components.tenant_collections import DEFAULT_TENANT
+
+DOCUMENT_STORE_PATH = os.environ.get("DOCUMENT_STORE_PATH", "vector_store")
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "2"))
+# Blocking SDK / HTTP / model calls run on this many threads
+IO_THREADS = int(os.environ.get("SERVICE_IO_THREADS", "64"))
+# Backpressure: at most this many requests of each kind run at once; the rest wait up
+# to QUEUE_TIMEOUT seconds for a slot and are then rejected with 503
+MAX_CONCURRENT_CHATS = int(os.environ.get("MAX_CONCURRENT_CHATS", "16"))
+MAX_CONCURRENT_SEARCHES = int(os.environ.get("MAX_CONCURRENT_SEARCHES", "32"))
+QUEUE_TIMEOUT = float(os.environ.get("QUEUE_TIMEOUT", "5"))
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+components: Dict = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="rag-io"))
+    ingestion_queue = IngestionQueue(max_workers=INGESTION_WORKERS)
+    tenants, nlp_processor, response_generator = create_tenant_components(
+        DOCUMENT_STORE_PATH,
+        sarvam_api_key=os.environ.get("SARVAM_API_KEY"),
+        hf_token=os.environ.get("HF_TOKEN"),
+        is_busy=ingestion_queue.has_pending,
+    )
+    components.update({
+        'tenants': tenants,
+        'nlp_processor': nlp_processor,
+        'response_generator': response_generator,
+        'ingestion_queue': ingestion_queue,
+        'chat_slots': asyncio.Semaphore(MAX_CONCURRENT_CHATS),
+        'search_slots': asyncio.Semaphore(MAX_CONCURRENT_SEARCHES),
+    })
+    yield
+    components['ingestion_queue'].shutdown(wait=False)
+
+app = FastAPI(title="Document Chatbot API", lifespan=lifespan)
+
+async def run_limited(slots: asyncio.Semaphore, func, *args):
+    """Run a blocking call on the I/O thread pool once a concurrency slot is free, or fail fast with 503."""
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly.", headers={"Retry-After": "1"})
+    try:
+        return await asyncio.to_thread(func, *args)
+    finally:
+        slots.release()
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    k: int = Field(5, ge=1, le=50)
+    translate: bool = True
+    # e.g. {"file_name": ["report.pdf"], "language": "hi-IN"}; a list accepts any of its values
+    filters: Optional[Dict[str, Any]] = None
+
+class ChatRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    language: str = "en-IN"
+    filters: Optional[Dict[str, Any]] = None
+
+def validate_filters(filters: Optional[Dict[str, Any]]):
+    try:
+        filters_to_where(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", **components['tenants'].stats()}
+
+@app.post("/ingest", status_code=202)
+async def ingest(file: UploadFile = File(...), x_tenant_id: str = Header(DEFAULT_TENANT)):
+    """Queue a document for background ingestion; poll /ingest/{job_id} for its status."""
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=415, detail=f"Unsupported file format: {extension}")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp_file:
+        while block := await file.read(1 << 20):
+            temp_file.write(block)
+        temp_file_path = temp_file.name
+    # Opening a tenant's collection reads its keyword index from disk, so keep it off the event loop
+    job = await asyncio.to_thread(_submit, x_tenant_id, temp_file_path, file.filename)
+    return {"job_id": job.id, "file_name": job.file_name, "status": job.status}
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = components['ingestion_queue'].get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {
+        "job_id": job.id,
+        "file_name": job.file_name,
+        "status": job.status,
+        "total_chunks": job.total_chunks,
+        "stored_chunks": job.stored_chunks,
+        "summary": job.summary,
+        "error": job.error,
+    }
+
+# Each request leases its tenant's collection, so it is not unloaded (and reopened) while in use
+
+def _submit(tenant_id: str, file_path: str, file_name: Optional[str]):
+    # Once queued, the pending job keeps the collection loaded
+    with components['tenants'].lease(tenant_id) as tenant:
+        return components['ingestion_queue'].submit(file_path, source_name=file_name, delete_file=True,
+                                                    doc_processor=tenant.doc_processor)
+
+def _search(tenant_id: str, query: str, k: int, translate: bool, filters: Optional[Dict[str, Any]]) -> List[Dict]:
+    if translate:
+        query = components['nlp_processor'].translate_text(query, source_lang="auto", target_lang='en-IN')
+    with components['tenants'].lease(tenant_id) as tenant:
+        return tenant.retriever.hybrid_search(query, k=k, filters=filters)
+
+def _chat(tenant_id: str, request: ChatRequest) -> Dict:
+    with components['tenants'].lease(tenant_id) as tenant:
+        return generate_chatbot_response(
+            request.query, components['nlp_processor'], tenant.retriever,
+            components['response_generator'], request.language, filters=request.filters
+        )
+
+@app.post("/search")
+async def search(request: SearchRequest, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    """Hybrid search; the query is translated to English first unless translate is false."""
+    validate_filters(request.filters)
+    results = await run_limited(components['search_slots'], _search, x_tenant_id, request.query, request.k,
+                                request.translate, request.filters)
+    return {"results": results}
+
+@app.post("/chat")
+async def chat(request: ChatRequest, x_tenant_id: str = Header(DEFAULT_TENANT)):
+    if request.language not in LANGUAGE_OPTIONS:
+        raise HTTPException(status_code=422, detail=f"Unsupported language: {request.language}")
+    validate_filters(request.filters)
+    return await run_limited(components['chat_slots'], _chat, x_tenant_id, request)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return pipeline_metrics.to_prometheus()